@@ -0,0 +1,173 @@
+"""Deterministic synthetic vaults for benchmarks.
+
+The same arguments and seed always produce byte-identical files, so timings
+from different versions of ted are measured on the same input.
+"""
+
+import os
+import random
+from datetime import datetime, timedelta
+
+WORDS = (
+    "alpha budget call client deploy draft email fix garden invoice kitchen "
+    "laptop meeting migrate notes order plan print refactor release renew "
+    "report review schedule server taxes ticket travel update upgrade write"
+).split()
+BASE_TIME = datetime(2025, 1, 1, 9, 0, 0)
+REF_TYPES = ("l", "n", "f")
+
+
+def _timestamp(minutes: int) -> str:
+    return (BASE_TIME + timedelta(minutes=minutes)).strftime("%m-%d-%Y_%H:%M:%S")
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _note(rng: random.Random, lines: int) -> str:
+    out = []
+    for i in range(lines):
+        if i and i % 12 == 0:
+            # Headings inside notes must not be mistaken for sections.
+            out.append(f"# {_words(rng, 2)}" if i % 24 == 0 else f"## {_words(rng, 3)}")
+        else:
+            out.append(_words(rng, rng.randint(4, 14)))
+    return "\n".join(out)
+
+
+def _write(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate_vault(
+    vault_dir: str,
+    todos: int = 1000,
+    dones: int = 1000,
+    projects: int = 20,
+    references: int = 100,
+    tags: int = 12,
+    chain_length: int = 4,
+    note_lines: int = 60,
+    subdirs: int = 4,
+    seed: int = 0,
+) -> dict:
+    """Write a vault with the given number of items into vault_dir.
+
+    Open todos are spread over `subdirs` subdirectories of todos/. Every
+    `chain_length` consecutive open todos form a blocked_by chain. Notes
+    have up to `note_lines` lines. Returns the counts that were written.
+    """
+    from ted.data_types import (
+        ProjectData,
+        Properties,
+        Reference,
+        ReferenceData,
+        Task,
+        TodoData,
+    )
+
+    rng = random.Random(seed)
+    dirs = {
+        name: os.path.join(vault_dir, name)
+        for name in ("todos", "done", "projects", "ref", "files", "inbox")
+    }
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+    for i in range(subdirs):
+        os.makedirs(os.path.join(dirs["todos"], f"area{i}"), exist_ok=True)
+
+    tag_pool = [f"tag{i}" for i in range(tags)] or ["tag0"]
+    project_ids = []
+    for i in range(1, projects + 1):
+        shorthand = f"PR{i:03d}"
+        _id = f"P{i:05d}_{shorthand}_{_words(rng, 2).replace(' ', '_')}"
+        project_ids.append(_id)
+        project = ProjectData(
+            id=_id,
+            name=_words(rng, 3),
+            shorthand=shorthand,
+            description=_words(rng, rng.randint(10, 40)),
+            properties=Properties(id=_id, created=_timestamp(i)),
+            filename=f"{_id}.md",
+            info=[_words(rng, 6) for _ in range(rng.randint(0, 4))],
+        )
+        _write(os.path.join(dirs["projects"], project.filename), str(project))
+
+    todo_files = []
+    previous = None
+    for i in range(1, todos + dones + 1):
+        done = i > todos
+        name = f"{_words(rng, rng.randint(2, 6))} {i}"
+        _id = f"T{i:05d}"
+        filename = f"{_id}_{name.replace(' ', '_')[:32]}.md"
+        if done:
+            directory = dirs["done"]
+        elif subdirs and i % (subdirs + 1):
+            directory = os.path.join(dirs["todos"], f"area{i % subdirs}")
+        else:
+            directory = dirs["todos"]
+
+        blocked_by = None
+        if not done and previous and chain_length > 1 and i % chain_length:
+            blocked_by = [previous]
+        n_tasks = rng.randint(1, 8)
+        todo = TodoData(
+            name=name,
+            goal=_words(rng, rng.randint(5, 20)),
+            filename=filename,
+            filepath=os.path.join(directory, filename),
+            tasks=[
+                Task(done=done or rng.random() < 0.4, description=_words(rng, 5))
+                for _ in range(n_tasks)
+            ],
+            properties=Properties(
+                id=_id,
+                created=_timestamp(projects + i),
+                completed=_timestamp(projects + i + 60) if done else None,
+                project_id=(
+                    rng.choice(project_ids)
+                    if project_ids and rng.random() < 0.6
+                    else None
+                ),
+                tags=rng.sample(tag_pool, rng.randint(0, min(3, len(tag_pool)))),
+                blocked_by=blocked_by,
+                info=_words(rng, 2) if rng.random() < 0.5 else "",
+            ),
+            info=[
+                f"{_timestamp(i)} | {_words(rng, 6)}" for _ in range(rng.randint(0, 5))
+            ],
+            note=_note(rng, rng.randint(0, note_lines)),
+        )
+        _write(todo.filepath, str(todo))
+        todo_files.append(filename)
+        previous = filename if not done else None
+
+    for i in range(1, references + 1):
+        _id = f"R{i:05d}"
+        ref_type = rng.choice(REF_TYPES)
+        content = f"https://example.com/{_words(rng, 2).replace(' ', '/')}"
+        if ref_type != "l":
+            content = f"{_words(rng, 2).replace(' ', '_')}.pdf"
+        reference = ReferenceData(
+            properties=Properties(id=_id, created=_timestamp(i)),
+            ref=Reference(type=ref_type, content=content),
+            task=rng.choice(todo_files) if todo_files else "",
+            filename=f"{_id}.md",
+            name=_words(rng, 3),
+            tldr=_words(rng, rng.randint(5, 30)),
+        )
+        _write(os.path.join(dirs["ref"], reference.filename), str(reference))
+
+    return {
+        "todos": todos,
+        "dones": dones,
+        "projects": projects,
+        "references": references,
+        "tags": len(tag_pool),
+        "chain_length": chain_length,
+        "note_lines": note_lines,
+        "subdirs": subdirs,
+        "seed": seed,
+    }
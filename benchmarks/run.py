@@ -0,0 +1,365 @@
+"""Time ted's hot paths on a synthetic vault and report JSON.
+
+    python -m benchmarks.run --todos 2000 --dones 2000 -o bench.json
+    python -m benchmarks.run --compare bench.json
+
+The vault is generated into a temporary HOME, so ~/.ted is never touched.
+Results are comparable between versions as long as the generator arguments
+are the same; --compare prints the ratio to an earlier result file.
+"""
+
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Run fn repeat times; fn returns how many operations one run did."""
+    times = []
+    ops = 1
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        ops = fn() or 1
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "repeat": repeat,
+        "ops": ops,
+        "min_s": best,
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "max_s": max(times),
+        "per_op_us": best / ops * 1e6,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check_frontmatter(paths: list[str]) -> dict:
+    """The fast frontmatter parser must agree with yaml.safe_load."""
+    import yaml
+
+    from ted.mdparse import parse_frontmatter, read_md_file, tokenize_md
+
+    mismatches = []
+    for path in paths:
+        frontmatter, _ = tokenize_md(read_md_file(path), raw_section=0)
+        if frontmatter is None:
+            continue
+        if parse_frontmatter(frontmatter) != (yaml.safe_load(frontmatter) or {}):
+            mismatches.append(os.path.basename(path))
+    return {"files": len(paths), "mismatches": mismatches}
+
+
+def scenarios(home: str, inbox_items: int):
+    """Yield (name, fn, setup) for every benchmark."""
+    from click.testing import CliRunner
+
+    import ted.cli as cli_module
+    from ted.config import Config
+    from ted.data_types import from_md_file, parse_properties
+    from ted.mdparse import read_md_file, read_md_header, summary_from_md
+    from ted.vault import Vault
+
+    config = Config()
+    vault = Vault(config)
+    data = vault.load_vault_data()
+    todo_paths = [todo.filepath for todo in data.todos + data.dones]
+    texts = [read_md_file(path) for path in todo_paths]
+    ids = [todo.id for todo in data.todos + data.dones]
+    runner = CliRunner()
+
+    def drop_parse_cache():
+        # The parse cache shards, the legacy single-file cache, the snapshot
+        # and the directory listings all let a "cold" load skip work.
+        base, ext = os.path.splitext(config.PARSE_CACHE_FILE)
+        paths = glob.glob(f"{glob.escape(base)}.*{ext}")
+        paths += [
+            config.PARSE_CACHE_FILE,
+            config.SNAPSHOT_FILE,
+            config.LISTING_CACHE_FILE,
+        ]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load_vault_data():
+        Vault(config).load_vault_data()
+        return len(todo_paths) + len(data.projects) + len(data.references)
+
+    yield "load_vault_data_cold", load_vault_data, drop_parse_cache
+    yield "load_vault_data_warm", load_vault_data, None
+
+    def parse_files():
+        for path in todo_paths:
+            from_md_file(path)
+        return len(todo_paths)
+
+    yield "from_md_file", parse_files, None
+
+    def scan_headers():
+        for path in todo_paths:
+            summary_from_md(read_md_header(path), path)
+        return len(todo_paths)
+
+    yield "summary_from_md_header", scan_headers, None
+
+    def parse_all_properties():
+        for text in texts:
+            parse_properties(text)
+        return len(texts)
+
+    yield "parse_properties", parse_all_properties, None
+
+    def render_todos():
+        for todo in data.todos + data.dones:
+            str(todo)
+        return len(todo_paths)
+
+    yield "todo_str", render_todos, None
+
+    def fresh_cli_vault():
+        cli_module._VAULT = None
+
+    def invoke(*args):
+        def run():
+            result = runner.invoke(cli_module.cli, list(args))
+            if result.exit_code != 0:
+                raise RuntimeError(f"ted {' '.join(args)} failed: {result.output}")
+
+        return run
+
+    yield "cli_ls", invoke("ls"), fresh_cli_vault
+    yield "cli_ls_tag_query", invoke("ls", "--tag", "tag0 and not tag1"), (
+        fresh_cli_vault
+    )
+    yield "cli_status", invoke("status"), fresh_cli_vault
+    yield "cli_search", invoke("search", "review", "rep"), fresh_cli_vault
+
+    def find_all():
+        for _id in ids:
+            data.find("todos", _id)
+            data.get_next_id("todos")
+        return len(ids)
+
+    yield "find_and_get_next_id", find_all, None
+
+    os.environ["TED_INBOX_DIR"] = os.path.join(home, "server", "inbox")
+    os.environ["TED_UPLOAD_DIR"] = os.path.join(home, "server", "uploads")
+    os.environ["TED_BLOB_DIR"] = os.path.join(home, "server", "blobs")
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            from ted.app import app
+        finally:
+            sys.stdout = stdout
+    client = app.test_client()
+
+    def clear_inbox():
+        client.post("/api/clear")
+
+    def add_items():
+        for i in range(inbox_items):
+            response = client.post(
+                "/add", data={"title": f"item {i}", "item": f"content {i}"}
+            )
+            if response.status_code != 302:
+                raise RuntimeError(f"/add returned {response.status_code}")
+        return inbox_items
+
+    yield "flask_add", add_items, clear_inbox
+
+    def add_items_concurrently(threads: int = 8):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def add_some(offset: int):
+            thread_client = app.test_client()
+            for i in range(offset, inbox_items, threads):
+                # Same title from every thread, to catch id collisions.
+                response = thread_client.post(
+                    "/add", data={"title": "same title", "item": f"content {i}"}
+                )
+                if response.status_code != 302:
+                    raise RuntimeError(f"/add returned {response.status_code}")
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(add_some, range(threads)))
+        inbox_dir = os.environ["TED_INBOX_DIR"]
+        stored = sum(name.endswith(".md") for name in os.listdir(inbox_dir))
+        if stored != inbox_items:
+            raise RuntimeError(f"{inbox_items} items added, {stored} stored")
+        return inbox_items
+
+    yield "flask_add_concurrent", add_items_concurrently, clear_inbox
+
+    def page_items():
+        count = 0
+        cursor = None
+        while True:
+            query = {"limit": 100}
+            if cursor:
+                query["since"] = cursor
+            page = client.get("/api/items", query_string=query).get_json()
+            count += len(page["items"])
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                return count
+
+    yield "flask_api_items", page_items, None
+
+    # Everything after this point runs with the SQLite index enabled.
+    vault.rebuild_index()
+    yield "cli_ls_sqlindex", invoke("ls"), fresh_cli_vault
+    yield "cli_ls_tag_query_sqlindex", invoke("ls", "--tag", "tag0 and not tag1"), (
+        fresh_cli_vault
+    )
+    yield "cli_show_sqlindex", invoke("show", ids[0]), fresh_cli_vault
+
+
+def compare(results: dict, baseline: dict):
+    old = baseline.get("results", {})
+    if baseline.get("meta", {}).get("vault") != results["meta"]["vault"]:
+        click.echo("Warning: baseline was run on a different vault.", err=True)
+    header = f"{'scenario':<24} {'baseline':>12} {'current':>12} {'ratio':>7}"
+    click.echo(header, err=True)
+    for name, result in results["results"].items():
+        if name not in old:
+            continue
+        before, after = old[name]["min_s"], result["min_s"]
+        ratio = after / before if before else float("inf")
+        click.echo(
+            f"{name:<24} {before * 1000:10.2f}ms {after * 1000:10.2f}ms {ratio:6.2f}x",
+            err=True,
+        )
+
+
+@click.command()
+@click.option("--todos", default=1000, show_default=True)
+@click.option("--dones", default=1000, show_default=True)
+@click.option("--projects", default=20, show_default=True)
+@click.option("--references", default=100, show_default=True)
+@click.option("--tags", default=12, show_default=True)
+@click.option("--chain-length", default=4, show_default=True)
+@click.option("--note-lines", default=60, show_default=True)
+@click.option("--inbox-items", default=200, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--repeat", "-r", default=5, show_default=True)
+@click.option("--only", multiple=True, help="Only run scenarios with this prefix")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="JSON file")
+@click.option("--compare", "baseline_file", type=click.Path(exists=True))
+@click.option("--keep", is_flag=True, help="Keep the generated vault")
+def main(
+    todos,
+    dones,
+    projects,
+    references,
+    tags,
+    chain_length,
+    note_lines,
+    inbox_items,
+    seed,
+    repeat,
+    only,
+    output,
+    baseline_file,
+    keep,
+):
+    """Generate a synthetic vault and time ted on it."""
+    home = tempfile.mkdtemp(prefix="ted-bench-")
+    # Config resolves ~/.ted at import time, so HOME is set before importing ted.
+    os.environ["HOME"] = home
+    os.environ["TED_NO_DAEMON"] = "1"
+    try:
+        from benchmarks.generate import generate_vault
+
+        start = time.perf_counter()
+        vault_args = generate_vault(
+            os.path.join(home, ".ted"),
+            todos=todos,
+            dones=dones,
+            projects=projects,
+            references=references,
+            tags=tags,
+            chain_length=chain_length,
+            note_lines=note_lines,
+            seed=seed,
+        )
+        click.echo(
+            f"Generated vault in {time.perf_counter() - start:.1f}s: {home}", err=True
+        )
+        # Files changed less than RACY_NS before a run are never cached, so
+        # let the generated ones age or every "warm" run would parse them all.
+        from ted.cache import RACY_NS
+
+        time.sleep(RACY_NS / 1e9)
+
+        vault_dir = os.path.join(home, ".ted")
+        md_files = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(vault_dir)
+            for name in names
+            if name.endswith(".md")
+        ]
+        results = {
+            "meta": {
+                "git_revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "repeat": repeat,
+                "inbox_items": inbox_items,
+                "vault": vault_args,
+            },
+            "checks": {"frontmatter_matches_safe_load": check_frontmatter(md_files)},
+            "results": {},
+        }
+        for name, fn, setup in scenarios(home, inbox_items):
+            if only and not name.startswith(only):
+                continue
+            results["results"][name] = result = measure(fn, repeat, setup)
+            click.echo(
+                f"{name:<24} {result['min_s'] * 1000:10.2f}ms"
+                f" {result['per_op_us']:10.1f}us/op",
+                err=True,
+            )
+    finally:
+        if not keep:
+            shutil.rmtree(home, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        click.echo(text)
+    if baseline_file:
+        with open(baseline_file) as f:
+            compare(results, json.load(f))
+    if results["checks"]["frontmatter_matches_safe_load"]["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
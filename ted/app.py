@@ -1,13 +1,23 @@
+import bisect
+import contextlib
+import fcntl
+import hashlib
 import os
+import threading
 from flask import (
     Flask,
+    jsonify,
     request,
     render_template,
     redirect,
     url_for,
     send_from_directory,
 )
-from ted.utils import new_timestamp, crop_filename
+from werkzeug.datastructures import FileStorage
+
+from ted.atomic import create_exclusive
+from ted.blobs import BlobStore
+from ted.utils import new_timestamp, new_ulid, crop_filename
 from ted.data_types import InboxItem, inbox_from_md
 
 app = Flask(__name__)
@@ -23,39 +33,87 @@ if not UPLOAD_DIR:
     UPLOAD_DIR = os.path.expanduser("~/.ted-server/uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+BLOB_DIR = os.environ.get("TED_BLOB_DIR")
+if not BLOB_DIR:
+    BLOB_DIR = os.path.expanduser("~/.ted-server/blobs")
+os.makedirs(BLOB_DIR, exist_ok=True)
+BLOBS = BlobStore(BLOB_DIR)
+
+# Held shared by /add and exclusively by /api/clear, across threads and
+# gunicorn workers, so a clear never removes an add's files mid-request.
+LOCK_FILE = os.environ.get("TED_LOCK_FILE")
+if not LOCK_FILE:
+    LOCK_FILE = os.path.expanduser("~/.ted-server/inbox.lock")
+os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Requests above this size are rejected with 413 before the body is read.
+app.config["MAX_CONTENT_LENGTH"] = int(
+    os.environ.get("TED_MAX_CONTENT_LENGTH", 512 * 1024 * 1024)
+)
+
 print(f"Using INBOX_DIR: {INBOX_DIR}")
 print(f"Using UPLOAD_DIR: {UPLOAD_DIR}")
 
 
+def save_upload(storage: FileStorage, dest_path: str) -> str:
+    """Stream an upload into the blob store and link it at dest_path.
+
+    Returns the SHA-256 computed while streaming; identical uploads share
+    one blob.
+    """
+    digest, _ = BLOBS.put_stream(
+        iter(lambda: storage.stream.read(UPLOAD_CHUNK_SIZE), b"")
+    )
+    BLOBS.link(digest, dest_path)
+    return digest
+
+
+@contextlib.contextmanager
+def inbox_lock(exclusive: bool):
+    # Every open() is its own flock, so threads of one worker exclude each
+    # other too. Closing the file releases the lock. Also usable as a
+    # decorator, which takes the lock anew on every call.
+    with open(LOCK_FILE, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
 
 
 @app.route("/add", methods=["POST"])
+@inbox_lock(exclusive=False)
 def add():
     item = request.form.get("item")
     photo = request.files.get("photo")
     file = request.files.get("file")
     title = request.form.get("title")
 
-    # Generate randomized ID
     timestamp = new_timestamp()
 
+    # ULIDs stay unique across threads and gunicorn workers, and sort by time.
     cropped_title = crop_filename(title, max_length=32)
-    inbox_id = f"{timestamp}_{cropped_title}"
+    inbox_id = f"{new_ulid()}_{cropped_title}"
     photo_filename = None
     file_filename = None
+    photo_sha256 = None
+    file_sha256 = None
     # Fix: Check if photo exists and filename is not empty string
     if photo and photo.filename and photo.filename != "":
-        photo_filename = f"photo_{inbox_id}_{photo.filename}"
+        photo_filename = f"photo_{inbox_id}_{os.path.basename(photo.filename)}"
         photo_path = os.path.join(UPLOAD_DIR, photo_filename)
-        photo.save(photo_path)
+        photo_sha256 = save_upload(photo, photo_path)
 
     if file and file.filename and file.filename != "":
-        file_filename = f"file_{inbox_id}_{file.filename}"
+        file_filename = f"file_{inbox_id}_{os.path.basename(file.filename)}"
         file_path = os.path.join(UPLOAD_DIR, file_filename)
-        file.save(file_path)
+        file_sha256 = save_upload(file, file_path)
 
     inbox_item = InboxItem(
         title=title,
@@ -64,31 +122,156 @@ def add():
         id=inbox_id,
         photo=photo_filename,
         file=file_filename,
+        photo_sha256=photo_sha256,
+        file_sha256=file_sha256,
     )
-    filename = f"{inbox_item.id}_{timestamp.replace(':', '').replace('-', '').replace(' ', '_')}.md"
+    filename = f"{inbox_item.id}.md"
     filepath = os.path.join(INBOX_DIR, filename)
-    with open(filepath, "w") as f:
-        f.write(str(inbox_item))
+    try:
+        create_exclusive(filepath, str(inbox_item))
+    except FileExistsError:
+        return {"status": "error", "message": f"{filename} already exists"}, 409
+    INDEX.add(filename, inbox_item)
     return redirect(url_for("index"))
 
 
+def parse_cursor(cursor: str | None) -> tuple[int, str]:
+    """Cursors are "<ctime_ns>:<filename>" of the last item a client has seen.
+
+    Items are not guaranteed to appear in cursor order: two can share a
+    timestamp tick and a file's ctime is taken before it is indexed. Clients
+    should ask again from somewhat before their cursor and skip filenames
+    they already have, as `ted inbox` does.
+    """
+    if not cursor:
+        return (-1, "")
+    mtime, _, filename = cursor.partition(":")
+    return (int(mtime), filename)
+
+
+def format_cursor(key: tuple[int, str]) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+class InboxIndex:
+    """Sorted in-memory index of inbox items keyed by (ctime_ns, filename).
+
+    The ctime is when a file was published in the inbox directory. Unlike
+    the mtime it is also updated by create_exclusive's link() and by copies
+    that preserve the mtime.
+
+    Built once from the inbox directory, updated by /add and /api/clear, and
+    rescanned whenever the directory mtime differs from the last scan.
+    Rescans only parse files whose key changed.
+    """
+
+    def __init__(self, inbox_dir: str):
+        self.inbox_dir = inbox_dir
+        self.lock = threading.Lock()
+        self.keys: list[tuple[int, str]] = []
+        self.items: dict[str, tuple[tuple[int, str], InboxItem]] = {}
+        self.dir_mtime: int | None = None
+        self.reload()
+
+    def current_dir_mtime(self) -> int | None:
+        try:
+            return os.stat(self.inbox_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        with self.lock:
+            dir_mtime = self.current_dir_mtime()
+            items = {}
+            try:
+                with os.scandir(self.inbox_dir) as it:
+                    for entry in it:
+                        # Skips temp files of writes still in progress.
+                        name = entry.name
+                        if name.startswith(".") or not name.endswith(".md"):
+                            continue
+                        if not entry.is_file():
+                            continue
+                        key = (entry.stat().st_ctime_ns, entry.name)
+                        known = self.items.get(entry.name)
+                        if known is not None and known[0] == key:
+                            items[entry.name] = known
+                            continue
+                        try:
+                            with open(entry.path, "r") as f:
+                                items[entry.name] = (key, inbox_from_md(f.read()))
+                        except (OSError, ValueError) as e:
+                            print(f"Skipping inbox file {entry.name}: {e}")
+            except FileNotFoundError:
+                pass
+            self.items = items
+            self.keys = sorted(key for key, _ in items.values())
+            self.dir_mtime = dir_mtime
+
+    def reconcile(self):
+        if self.current_dir_mtime() != self.dir_mtime:
+            self.reload()
+
+    def add(self, filename: str, inbox_item: InboxItem):
+        """Index a file this process just wrote.
+
+        dir_mtime is left alone: the write changed the directory mtime, so
+        the next request rescans and picks up any outside change made
+        meanwhile, reusing the items already parsed.
+        """
+        key = (os.stat(os.path.join(self.inbox_dir, filename)).st_ctime_ns, filename)
+        with self.lock:
+            old = self.items.get(filename)
+            if old is not None:
+                self.keys.pop(bisect.bisect_left(self.keys, old[0]))
+            self.items[filename] = (key, inbox_item)
+            bisect.insort(self.keys, key)
+
+    def page(self, since: tuple[int, str], limit: int):
+        self.reconcile()
+        with self.lock:
+            start = bisect.bisect_right(self.keys, since)
+            keys = self.keys[start : start + limit]
+            has_more = start + limit < len(self.keys)
+            return [(key, self.items[key[1]][1]) for key in keys], has_more
+
+
+INDEX = InboxIndex(INBOX_DIR)
+
+
 @app.route("/api/items", methods=["GET"])
 def get_items():
-    items = []
     try:
-        for filename in sorted(os.listdir(INBOX_DIR)):
-            filepath = os.path.join(INBOX_DIR, filename)
-            if os.path.isfile(filepath):
-                with open(filepath, "r") as f:
-                    content = f.read()
-                    inbox_item = inbox_from_md(content)
-                items.append(
-                    {"filename": filename, "content": inbox_item.model_dump_json()}
-                )
-        return {"items": items}
-    except FileNotFoundError:
-        pass
-    return {"items": items}
+        since = parse_cursor(request.args.get("since"))
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return {"status": "error", "message": "Invalid since or limit"}, 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    page, has_more = INDEX.page(since, limit)
+    next_cursor = format_cursor(page[-1][0]) if page else request.args.get("since")
+
+    etag_parts = [str(since), str(limit)] + [format_cursor(key) for key, _ in page]
+    etag = hashlib.sha1("\n".join(etag_parts).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    items = [
+        {
+            "filename": key[1],
+            "cursor": format_cursor(key),
+            "item": inbox_item.model_dump(),
+        }
+        for key, inbox_item in page
+    ]
+
+    response = jsonify(
+        {"items": items, "next_cursor": next_cursor, "has_more": has_more}
+    )
+    response.set_etag(etag)
+    return response
 
 
 @app.route("/uploads/<filename>")
@@ -101,18 +284,21 @@ def uploaded_file(filename):
 def clear_items():
     """Clear all inbox items and uploaded photos."""
     try:
-        # Delete all markdown files in inbox
-        for filename in os.listdir(INBOX_DIR):
-            filepath = os.path.join(INBOX_DIR, filename)
-            if os.path.isfile(filepath) and filename.endswith(".md"):
-                os.remove(filepath)
-
-        # Delete all photos in uploads
-        for filename in os.listdir(UPLOAD_DIR):
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(filepath):
-                os.remove(filepath)
+        with inbox_lock(exclusive=True):
+            # Delete all markdown files in inbox
+            for filename in os.listdir(INBOX_DIR):
+                filepath = os.path.join(INBOX_DIR, filename)
+                if os.path.isfile(filepath) and filename.endswith(".md"):
+                    os.remove(filepath)
+
+            # Delete all photos in uploads
+            for filename in os.listdir(UPLOAD_DIR):
+                filepath = os.path.join(UPLOAD_DIR, filename)
+                if os.path.isfile(filepath):
+                    os.remove(filepath)
 
+            BLOBS.gc([UPLOAD_DIR])
+            INDEX.reload()
         return {"status": "success", "message": "All items cleared"}
     except Exception as e:
         return {"status": "error", "message": str(e)}, 500
@@ -0,0 +1,142 @@
+import os
+import tempfile
+
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Called as hook(written, removed) with the paths of every committed
+# transaction, e.g. to keep an index of the vault up to date.
+_COMMIT_HOOKS: list = []
+
+
+def on_commit(hook):
+    if hook not in _COMMIT_HOOKS:
+        _COMMIT_HOOKS.append(hook)
+
+
+def remove_commit_hook(hook):
+    if hook in _COMMIT_HOOKS:
+        _COMMIT_HOOKS.remove(hook)
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class VaultTransaction:
+    """Stage file writes and removals and apply them together.
+
+    Every write goes to a hidden temp file next to its target and is fsynced
+    right away. commit() renames all temp files into place, then applies the
+    removals, then fsyncs each touched directory once. A crash before commit
+    leaves the vault untouched. A crash during commit can leave a duplicate
+    (for example a todo in both todos/ and done/), but never a truncated file.
+    """
+
+    def __init__(self):
+        self.writes: list[tuple[str, str]] = []
+        self.removes: list[str] = []
+
+    def write(self, path: str, text: str, encoding: str = "utf-8"):
+        dirname = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirname, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            os.fchmod(fd, 0o666 & ~_UMASK)
+            with os.fdopen(fd, "w", encoding=encoding) as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.writes.append((path, tmp_path))
+
+    def remove(self, path: str):
+        self.removes.append(path)
+
+    def commit(self):
+        dirs = set()
+        for path, tmp_path in self.writes:
+            os.replace(tmp_path, path)
+            dirs.add(os.path.dirname(path) or ".")
+        for path in self.removes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            dirs.add(os.path.dirname(path) or ".")
+        for dirname in dirs:
+            _fsync_dir(dirname)
+        written = [path for path, _ in self.writes]
+        removed = self.removes
+        self.writes = []
+        self.removes = []
+        for hook in _COMMIT_HOOKS:
+            hook(written, removed)
+
+    def rollback(self):
+        for _, tmp_path in self.writes:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        self.writes = []
+        self.removes = []
+
+    def __enter__(self) -> "VaultTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+def atomic_write(path: str, text: str, encoding: str = "utf-8"):
+    with VaultTransaction() as tx:
+        tx.write(path, text, encoding=encoding)
+
+
+def create_exclusive(path: str, text: str, encoding: str = "utf-8"):
+    """Create path with text; raise FileExistsError if it already exists.
+
+    The text is written to a temp file and hard-linked into place, which
+    fails instead of replacing an existing file, so concurrent writers
+    never overwrite each other and readers never see a partial file. Where
+    hard links are not supported the file is opened with O_EXCL instead.
+    """
+    dirname = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, "w", encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            raise
+        except OSError:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+            with os.fdopen(os.open(path, flags, 0o666), "w", encoding=encoding) as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+    finally:
+        os.remove(tmp_path)
+    _fsync_dir(dirname)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 1 << 20
+# gc leaves blobs stored or reused (by mtime) this recently alone: put_stream
+# returns before the caller has linked the blob anywhere.
+GC_GRACE_NS = 3600 * 1_000_000_000
+FICLONE = 0x40049409  # Linux ioctl to reflink one file onto another
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(src: str, dest: str):
+    import fcntl
+
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _unchanged_copy(known: list) -> str | None:
+    path, size, mtime_ns = known
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+        return None
+    return path
+
+
+class BlobStore:
+    """Content-addressed attachment store under root/<ab>/<sha256>.
+
+    Files keep their human-readable names elsewhere as reflinks of a blob,
+    or hardlinks sharing its read-only inode, so an attachment is stored
+    once however many names it has. Where neither works (another
+    filesystem) the name gets a plain copy, and a blob no other name shares
+    is then dropped; the copy is remembered in root/copies.json so the
+    content still counts as stored (see has()).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.copies_file = os.path.join(root, "copies.json")
+        self._copies_lock = threading.Lock()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest: str | None) -> bool:
+        if not digest:
+            return False
+        return os.path.exists(self.path(digest)) or self.copy_of(digest) is not None
+
+    def _load_copies(self) -> dict[str, list]:
+        try:
+            with open(self.copies_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_copies(self, copies: dict[str, list]):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(copies, f)
+        os.replace(tmp_path, self.copies_file)
+
+    def copy_of(self, digest: str) -> str | None:
+        """Path of a plain copy standing in for a dropped blob, if it is
+        still there and unchanged."""
+        known = self._load_copies().get(digest)
+        return None if known is None else _unchanged_copy(known)
+
+    def _record_copy(self, digest: str, path: str):
+        st = os.stat(path)
+        with self._copies_lock:
+            copies = self._load_copies()
+            copies[digest] = [path, st.st_size, st.st_mtime_ns]
+            self._save_copies(copies)
+
+    def _adopt(self, tmp_path: str, digest: str) -> str:
+        blob_path = self.path(digest)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            # Restarts the GC_GRACE_NS window for the new caller.
+            os.utime(blob_path)
+            return digest
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, blob_path)
+        return digest
+
+    def put_stream(self, chunks) -> tuple[str, int]:
+        """Store an iterable of byte chunks; returns (digest, size)."""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            return self._adopt(tmp_path, digest.hexdigest()), size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_file(self, src_path: str) -> str:
+        with open(src_path, "rb") as f:
+            digest, _ = self.put_stream(iter(lambda: f.read(CHUNK_SIZE), b""))
+        return digest
+
+    def link(self, digest: str, dest_path: str) -> str:
+        """Expose a blob at dest_path; returns "reflink", "hardlink" or "copy".
+
+        A reflink gets its own writable inode. A hardlink shares the blob's
+        read-only inode, so editing it in place fails instead of changing
+        every name; editors that save by renaming a new file over it just
+        leave the blob behind for gc. A copy may replace the blob,
+        see BlobStore.
+        """
+        blob_path = self.path(digest)
+        src_path = blob_path if os.path.exists(blob_path) else self.copy_of(digest)
+        if src_path is None:
+            raise FileNotFoundError(f"Blob {digest} is not in the store")
+        if os.path.exists(dest_path) and os.path.samefile(src_path, dest_path):
+            return "hardlink"
+        tmp_path = dest_path + ".link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            _reflink(src_path, tmp_path)
+            os.chmod(tmp_path, 0o644)
+            method = "reflink"
+        except (OSError, ImportError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            method = "copy"
+            if src_path == blob_path:
+                try:
+                    os.link(blob_path, tmp_path)
+                    method = "hardlink"
+                except OSError:
+                    pass
+            if method == "copy":
+                shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        if method == "copy" and src_path == blob_path:
+            # Hardlinked names cost nothing extra; otherwise the copy holds
+            # the only other instance of the content.
+            if os.stat(blob_path).st_nlink == 1:
+                self._record_copy(digest, dest_path)
+                os.remove(blob_path)
+        return method
+
+    def blobs(self):
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_file():
+                    yield entry
+
+    def gc(self, roots: list[str], dry_run: bool = False) -> tuple[int, int]:
+        """Remove blobs no file under roots refers to; returns (count, bytes).
+
+        A hardlinked blob is referenced while its link count is above one.
+        Reflinked names are matched by hashing files under roots whose size
+        equals that of an otherwise unreferenced blob. Blobs whose mtime is
+        within GC_GRACE_NS are kept. Copies that were removed or edited are
+        forgotten.
+        """
+        if not dry_run:
+            with self._copies_lock:
+                copies = self._load_copies()
+                live = {
+                    digest: known
+                    for digest, known in copies.items()
+                    if _unchanged_copy(known) is not None
+                }
+                if live != copies:
+                    self._save_copies(live)
+
+        candidates: dict[str, os.DirEntry] = {}
+        cutoff_ns = time.time_ns() - GC_GRACE_NS
+        for entry in self.blobs():
+            st = entry.stat()
+            if st.st_nlink <= 1 and st.st_mtime_ns < cutoff_ns:
+                candidates[entry.name] = entry
+        sizes = {entry.stat().st_size for entry in candidates.values()}
+
+        for root in roots:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if not candidates:
+                        break
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        if os.path.getsize(path) not in sizes:
+                            continue
+                        candidates.pop(file_sha256(path), None)
+                    except OSError:
+                        continue
+
+        removed_bytes = 0
+        for entry in candidates.values():
+            removed_bytes += entry.stat().st_size
+            if not dry_run:
+                os.remove(entry.path)
+        return len(candidates), removed_bytes
@@ -0,0 +1,378 @@
+import os
+import pickle
+import time
+
+from ted.snapshot import Snapshot, SnapshotRecord, write_snapshot
+
+CACHE_VERSION = 3
+# Coarsest timestamp granularity guarded against (FAT has 2 s mtimes).
+RACY_NS = 2_000_000_000
+
+
+def stat_key(st: os.stat_result) -> tuple[int, int, int, int]:
+    """(mtime_ns, size, ino, ctime_ns): what must match for a cache hit.
+
+    The inode catches files replaced by a rename, the ctime changes with
+    every write even when the mtime is set back.
+    """
+    return (st.st_mtime_ns, st.st_size, st.st_ino, st.st_ctime_ns)
+
+
+def is_racy(st: os.stat_result, checked_ns: int) -> bool:
+    """Whether st was taken less than RACY_NS after the last change.
+
+    Another write within the same timestamp tick would leave the stat
+    result unchanged, so what was read then must not be cached.
+    checked_ns is a time at or before the stat call.
+    """
+    return checked_ns - max(st.st_mtime_ns, st.st_ctime_ns) < RACY_NS
+
+
+class ParseCache:
+    """On-disk cache of parsed vault files keyed by path and stat_key.
+
+    Only files whose stat_key changed since the last run are handed to the
+    parser again; everything else is returned from the pickled cache. Files
+    changed just before they were stat'ed are not cached (see is_racy).
+
+    shards maps names to directories. Entries under each directory are
+    pickled to their own file next to cache_file, e.g. parse_cache.done.pkl,
+    and a shard is only unpickled when a path under its directory is first
+    looked up, so loading open todos does not decode the done ones. Other
+    paths go to the "other" shard.
+
+    If snapshot_file exists the cache lives there instead (see
+    ted/snapshot.py): rows are unpickled only when looked up and unchanged
+    rows are copied as raw bytes on save.
+    """
+
+    def __init__(
+        self,
+        cache_file: str,
+        snapshot_file: str | None = None,
+        shards: dict[str, str] | None = None,
+    ):
+        self.cache_file = cache_file
+        self.snapshot_file = snapshot_file
+        self.shards = {**(shards or {}), "other": None}
+        self._prefixes = [
+            (name, os.path.join(root, "")) for name, root in (shards or {}).items()
+        ]
+        # Entries of the shards in self.loaded.
+        self.entries: dict[str, tuple[tuple, object]] = {}
+        self.loaded: set[str] = set()
+        self.snapshot: Snapshot | None = None
+        # Snapshot rows not unpickled yet, by path.
+        self.snapshot_rows: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.dirty_shards: set[str] = set()
+        self.load()
+
+    @property
+    def snapshot_enabled(self) -> bool:
+        return self.snapshot_file is not None and os.path.exists(self.snapshot_file)
+
+    def shard_file(self, name: str) -> str:
+        base, ext = os.path.splitext(self.cache_file)
+        return f"{base}.{name}{ext}"
+
+    def shard_of(self, path: str) -> str:
+        for name, prefix in self._prefixes:
+            if path.startswith(prefix):
+                return name
+        return "other"
+
+    def enable_snapshot(self):
+        """Keep the cache in snapshot_file from the next save() on."""
+        if self.snapshot_file is None:
+            raise ValueError("No snapshot file configured")
+        if not self.snapshot_enabled:
+            self.load_all()
+            write_snapshot(self.snapshot_file, [])
+        self.dirty = True
+
+    def disable_snapshot(self):
+        if self.snapshot_enabled:
+            os.remove(self.snapshot_file)
+        self.load_all()
+        # Rows still in the old mapping would not be written to the pickle.
+        for path, row in self.snapshot_rows.items():
+            self.entries[path] = (self.snapshot.key(row), self.snapshot.item(row))
+        self.snapshot_rows = {}
+        self.dirty = True
+        self.dirty_shards = set(self.shards)
+
+    def load(self):
+        if not self.snapshot_enabled:
+            # Shards are unpickled on first use, see load_shard().
+            return
+        # The snapshot holds every shard.
+        self.loaded = set(self.shards)
+        try:
+            self.snapshot = Snapshot(self.snapshot_file)
+        except (OSError, ValueError):
+            # Rewritten from scratch on the next save.
+            return
+        self.snapshot_rows = dict(self.snapshot.rows)
+
+    def load_shard(self, name: str):
+        if name in self.loaded:
+            return
+        self.loaded.add(name)
+        try:
+            with open(self.shard_file(name), "rb") as f:
+                payload = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if payload.get("version") != CACHE_VERSION:
+            return
+        self.entries.update(payload.get("entries", {}))
+
+    def load_all(self):
+        for name in self.shards:
+            self.load_shard(name)
+
+    def _changed(self, path: str):
+        self.dirty = True
+        self.dirty_shards.add(self.shard_of(path))
+
+    def save(self):
+        if not self.dirty:
+            return
+        if self.snapshot_enabled:
+            self.save_snapshot()
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        shard_entries: dict[str, dict] = {name: {} for name in self.dirty_shards}
+        for path, entry in self.entries.items():
+            entries = shard_entries.get(self.shard_of(path))
+            if entries is not None:
+                entries[path] = entry
+        for name, entries in shard_entries.items():
+            shard_file = self.shard_file(name)
+            tmp_file = shard_file + ".tmp"
+            with open(tmp_file, "wb") as f:
+                pickle.dump(
+                    {"version": CACHE_VERSION, "entries": entries},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_file, shard_file)
+        if os.path.exists(self.cache_file):
+            # Written by versions that kept the whole cache in one file.
+            os.remove(self.cache_file)
+        self.dirty = False
+        self.dirty_shards = set()
+
+    def save_snapshot(self):
+        records = [
+            (
+                SnapshotRecord.from_item(path, key, item),
+                pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+            for path, (key, item) in self.entries.items()
+        ]
+        for path, row in self.snapshot_rows.items():
+            records.append(
+                (self.snapshot.record(row, path), self.snapshot.payload(row))
+            )
+        write_snapshot(self.snapshot_file, records)
+        self.dirty = False
+
+    def lookup(self, filepath: str, st: os.stat_result | None = None):
+        """Return the stat result and the cached item, or None on a miss.
+
+        Pass st if the file was just stat'ed, e.g. by Vault.get_files.
+        """
+        if st is None:
+            st = os.stat(filepath)
+        self.load_shard(self.shard_of(filepath))
+        key = stat_key(st)
+        entry = self.entries.get(filepath)
+        if entry is None and filepath in self.snapshot_rows:
+            row = self.snapshot_rows[filepath]
+            if self.snapshot.key(row) == key:
+                del self.snapshot_rows[filepath]
+                entry = (key, self.snapshot.item(row))
+                self.entries[filepath] = entry
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return st, entry[1]
+        self.misses += 1
+        return st, None
+
+    def store(
+        self,
+        filepath: str,
+        st: os.stat_result,
+        item,
+        checked_ns: int | None = None,
+    ):
+        """Cache item parsed from filepath, which was stat'ed as st.
+
+        checked_ns is a time taken before that stat call, default now;
+        racy files are dropped from the cache instead of stored.
+        """
+        if checked_ns is None:
+            checked_ns = time.time_ns()
+        self.load_shard(self.shard_of(filepath))
+        if self.snapshot_rows.pop(filepath, None) is not None:
+            self.dirty = True
+        if item is not None and not is_racy(st, checked_ns):
+            self.entries[filepath] = (stat_key(st), item)
+            self._changed(filepath)
+        elif filepath in self.entries:
+            del self.entries[filepath]
+            self._changed(filepath)
+
+    def prune(self, seen: set[str], roots: list[str] | None = None):
+        """Drop entries under roots (default: everywhere) that were not seen."""
+        if roots is None:
+            self.load_all()
+        for root in roots or []:
+            prefix = os.path.join(root, "")
+            self.load_shard(self.shard_of(prefix))
+            for name, shard_prefix in self._prefixes:
+                if shard_prefix.startswith(prefix):
+                    self.load_shard(name)
+        prefixes = tuple(os.path.join(root, "") for root in roots or [""])
+        stale = [
+            path
+            for path in [*self.entries, *self.snapshot_rows]
+            if path not in seen and path.startswith(prefixes)
+        ]
+        for path in stale:
+            self.entries.pop(path, None)
+            self.snapshot_rows.pop(path, None)
+            self._changed(path)
+        return len(stale)
+
+    def clear(self):
+        self.entries = {}
+        self.snapshot_rows = {}
+        self.loaded = set(self.shards)
+        self.hits = 0
+        self.misses = 0
+        self.dirty = True
+        self.dirty_shards = set(self.shards)
+
+    def stats(self) -> dict:
+        self.load_all()
+        kinds: dict[str, int] = {}
+        for _, item in self.entries.values():
+            kind = type(item).__name__
+            kinds[kind] = kinds.get(kind, 0) + 1
+        for row in self.snapshot_rows.values():
+            kind = self.snapshot.kind(row)
+            kinds[kind] = kinds.get(kind, 0) + 1
+        if self.snapshot_enabled:
+            cache_file = self.snapshot_file
+            files = [self.snapshot_file]
+        else:
+            base, ext = os.path.splitext(self.cache_file)
+            cache_file = f"{base}.*{ext}"
+            files = [self.shard_file(name) for name in self.shards]
+        size = sum(os.path.getsize(file) for file in files if os.path.exists(file))
+        return {
+            "file": cache_file,
+            "size": size,
+            "entries": len(self.entries) + len(self.snapshot_rows),
+            "kinds": kinds,
+        }
+
+
+def listing_key(st: os.stat_result) -> tuple[int, int, int, int]:
+    """(mtime_ns, ino, ctime_ns, nlink) of a directory, see ListingCache."""
+    return (st.st_mtime_ns, st.st_ino, st.st_ctime_ns, st.st_nlink)
+
+
+class ListingCache:
+    """Names in each vault directory, keyed by the directory's listing_key.
+
+    Creating, deleting or renaming an entry changes the mtime and ctime of
+    the directory that holds it, so a directory whose key is unchanged does
+    not need to be listed again; the inode catches a directory replaced by
+    another one. Editing a file in place changes none of them, which is why
+    files are still stat'ed on every walk. Like the parse cache, listings
+    taken within RACY_NS of the directory's last change are not kept.
+    """
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.listings: dict[str, tuple[tuple, list[str]]] = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_file, "rb") as f:
+                payload = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if payload.get("version") != CACHE_VERSION:
+            return
+        self.listings = payload.get("listings", {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(
+                {"version": CACHE_VERSION, "listings": self.listings},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_file, self.cache_file)
+        self.dirty = False
+
+    def get(self, directory: str, key: tuple) -> list[str] | None:
+        """Names in directory as last listed, if its listing_key is unchanged.
+
+        Subdirectory names end in "/".
+        """
+        known = self.listings.get(directory)
+        if known is not None and known[0] == key:
+            return known[1]
+        return None
+
+    def store(
+        self,
+        directory: str,
+        st: os.stat_result,
+        names: list[str],
+        checked_ns: int | None = None,
+    ):
+        """Remember names listed from directory, which was stat'ed as st.
+
+        checked_ns is a time taken before that stat call, default now.
+        """
+        if checked_ns is None:
+            checked_ns = time.time_ns()
+        if is_racy(st, checked_ns):
+            return
+        entry = (listing_key(st), names)
+        if self.listings.get(directory) != entry:
+            self.listings[directory] = entry
+            self.dirty = True
+
+    def prune(self, visited: set[str], root: str):
+        """Forget listings of directories under root that no longer exist."""
+        prefix = os.path.join(root, "")
+        stale = [
+            directory
+            for directory in self.listings
+            if directory not in visited
+            and (directory == root or directory.startswith(prefix))
+        ]
+        for directory in stale:
+            del self.listings[directory]
+        if stale:
+            self.dirty = True
+
+    def clear(self):
+        self.listings = {}
+        self.dirty = True
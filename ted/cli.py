@@ -1,37 +1,85 @@
 import os
-from datetime import datetime
-import shutil
-import click
-import requests  # Added for HTTP requests
-from ted.config import Config
-from ted.data_types import (
-    Properties,
-    TodoData,
-    ProjectData,
-    ReferenceData,
-    Task,
-    ReferenceType,
-    create_reference,
-    InboxItem,
-)
-from ted.utils import (
-    prompt_todo_selection,
-    prompt_project_selection,
-    new_timestamp,
-    crop_filename,
-)
-from ted.data_types import from_md_file, proj_from_md_file
+import sys
+import time
+
+_IMPORT_START = time.perf_counter()
 
-from ted.vault import Vault
+import click  # noqa: E402
+
+from ted.config import Config  # noqa: E402
 
 CONFIG = Config()
-VAULT = Vault(CONFIG)
+INBOX_PAGE_SIZE = 200
+# ted inbox asks again for items this much older than its cursor, since the
+# server may index items out of cursor order; see ted/app.py parse_cursor.
+INBOX_LOOKBACK_NS = 60 * 1_000_000_000
+PROFILE_MODES = {"1": "text", "true": "text", "text": "text", "json": "json"}
+_VAULT = None
+_WORKERS: int | None = None
+
+
+def get_vault():
+    """Create the Vault on first use so commands without vault work stay fast."""
+    global _VAULT
+    if _VAULT is None:
+        from ted.vault import Vault
+
+        _VAULT = Vault(CONFIG)
+        if _WORKERS is not None:
+            _VAULT.workers = _WORKERS
+    return _VAULT
 
 
 @click.group()
-def cli():
-    """TED - the todo buddy"""
-    pass
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Worker processes for parsing the vault (default: $TED_LOAD_WORKERS or 1)",
+)
+@click.option(
+    "--startup-profile",
+    is_flag=True,
+    help="Print an import-time breakdown to stderr when the command exits",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print per-phase timings, counters and peak memory to stderr",
+)
+@click.option("--profile-json", is_flag=True, help="Like --profile, but as JSON")
+@click.option(
+    "--strict",
+    is_flag=True,
+    help="Fully validate every file while loading instead of trusting the "
+    "parser (default: $TED_STRICT)",
+)
+@click.pass_context
+def cli(ctx, workers, startup_profile, profile, profile_json, strict):
+    """TED - the todo buddy
+
+    Profiling can also be enabled with TED_PROFILE=1 or TED_PROFILE=json.
+    """
+    global _WORKERS
+    _WORKERS = workers
+    if strict:
+        Config.STRICT = True
+    if profile_json:
+        profile = "json"
+    elif profile:
+        profile = "text"
+    else:
+        profile = PROFILE_MODES.get(os.environ.get("TED_PROFILE", "").lower())
+    if profile:
+        from ted import profiling
+
+        profiler = profiling.enable()
+        # Import the vault stack before tracemalloc starts; tracing makes
+        # imports several times slower and would drown out everything else.
+        with profiler.phase("import"):
+            import ted.vault  # noqa: F401
+        profiler.trace_memory()
+        ctx.call_on_close(lambda: profiling.disable().report(profile))
 
 
 @cli.command()
@@ -52,9 +100,12 @@ def new():
 @click.option("--project", "-p", help="Project ID to associate with this task")
 def new_task(name: str, goal: str, tasks: str, project=None):
     """Create a new todo task."""
-    VAULT_DATA = VAULT.load_vault_data()
+    from ted.data_types import Properties, TodoData, Task, proj_from_md_file
+    from ted.utils import new_timestamp, crop_filename
+
+    VAULT = get_vault()
     creation_timestamp = new_timestamp()
-    next_id = VAULT_DATA.get_next_id("todos")
+    next_id = VAULT.get_next_id("todos")
     project = proj_from_md_file(os.path.join(Config.PROJECTS_DIR, f"{project}.md")) if project else None
     if project and project.shorthand:
         _id = f"{project.shorthand}{next_id:03d}"
@@ -83,7 +134,11 @@ def new_task(name: str, goal: str, tasks: str, project=None):
 
 @cli.command()
 def newt():
-    VAULT_DATA = VAULT.load_vault_data()
+    from ted.data_types import Properties, TodoData, Task
+    from ted.utils import prompt_project_selection, new_timestamp, crop_filename
+
+    VAULT = get_vault()
+    VAULT_DATA = VAULT.load_vault_data(todos=False, dones=False, references=False)
     name = click.prompt("Enter the new name", type=str)
     goal = click.prompt("Enter passing criteria", type=str)
     next = click.prompt("Next task to do", type=str)
@@ -91,7 +146,7 @@ def newt():
     project = prompt_project_selection(VAULT_DATA.projects)
 
     creation_timestamp = new_timestamp()
-    next_id = VAULT_DATA.get_next_id("todos")
+    next_id = VAULT.get_next_id("todos")
     if project and project.shorthand:
         _id = f"{project.shorthand}{next_id:03d}"
     else:
@@ -120,7 +175,10 @@ def newt():
 
 @cli.command()
 def newp():
-    VAULT_DATA = VAULT.load_vault_data()
+    from ted.data_types import Properties, ProjectData
+    from ted.utils import new_timestamp, crop_filename
+
+    VAULT = get_vault()
     name = click.prompt("Enter the new project name", type=str)
     description = click.prompt("Enter project description", type=str)
     shorthand = click.prompt(
@@ -135,7 +193,7 @@ def newp():
 
     shorthand = shorthand.upper()
     creation_timestamp = new_timestamp()
-    next_id = VAULT_DATA.get_next_id("projects")
+    next_id = VAULT.get_next_id("projects")
     _id = f"P{next_id:05d}_{shorthand}_{crop_filename(name)}"
 
     properties = Properties(id=_id, created=creation_timestamp)
@@ -153,7 +211,18 @@ def newp():
 
 @cli.command()
 def newr():
-    VAULT_DATA = VAULT.load_vault_data()
+    from datetime import datetime
+    from ted.blobs import BlobStore
+    from ted.data_types import (
+        Properties,
+        ReferenceData,
+        ReferenceType,
+        create_reference,
+    )
+    from ted.utils import prompt_todo_selection, new_timestamp
+
+    VAULT = get_vault()
+    VAULT_DATA = VAULT.load_vault_data(dones=False, projects=False, references=False)
     type_str = click.prompt(
         "Enter reference type: ",
         type=click.Choice([t.value for t in ReferenceType]),
@@ -171,8 +240,10 @@ def newr():
         if not os.path.isfile(ref_content):
             click.echo(f"File does not exist: {ref_content}")
             return
+        store = BlobStore(Config.BLOB_DIR)
+        digest = store.put_file(ref_content)
         ref_content = os.path.basename(ref_content)
-        shutil.copy(ref_content, os.path.join(Config.FILES_DIR, ref_content))
+        store.link(digest, os.path.join(Config.FILES_DIR, ref_content))
     elif ref_type == ReferenceType.NOTEBOOK:
         ref_content = click.prompt("Enter the reference content", type=str)
         date = datetime.now().strftime("%Y-%m-%d")
@@ -186,7 +257,7 @@ def newr():
 
     tldr = click.prompt("Enter TLDR for the reference", type=str, default="")
     task = todo.filename
-    next_id = VAULT_DATA.get_next_id("references")
+    next_id = VAULT.get_next_id("references")
     _id = f"R{next_id:05d}"
     filename = f"{_id}.md"
     creation_timestamp = new_timestamp()
@@ -207,7 +278,12 @@ def newr():
 
 @cli.command()
 def block():
-    VAULT_DATA = VAULT.load_vault_data()
+    from ted.utils import prompt_todo_selection
+
+    VAULT = get_vault()
+    VAULT_DATA = VAULT.load_vault_data(
+        dones=False, projects=False, references=False
+    )
     click.echo("Select the todo to be blocked:")
     todo = prompt_todo_selection(VAULT_DATA.todos)
     if not todo:
@@ -237,16 +313,20 @@ def block():
     default=None,
 )
 def update(todo_id):
-    VAULT_DATA = VAULT.load_vault_data()
-    todos = VAULT_DATA.todos
+    from ted.utils import prompt_todo_selection
+
+    VAULT = get_vault()
     if todo_id is None:
-        todo_id = prompt_todo_selection(todos)[0]
+        VAULT_DATA = VAULT.load_vault_data(
+            dones=False, projects=False, references=False
+        )
+        todo_id = prompt_todo_selection(VAULT_DATA.todos)[0]
 
     if todo_id is None:
         click.echo("No todo selected for update.")
         return
 
-    todo = VAULT_DATA.find("todos", todo_id)
+    todo = VAULT.find("todos", todo_id)
 
     if not todo:
         click.echo(f"Todo with ID {todo_id} not found or invalid.")
@@ -297,6 +377,8 @@ def update(todo_id):
     default=None,
 )
 def update_file(todo_file):
+    from ted.data_types import from_md_file
+
     if not todo_file:
         click.echo("No todo file specified for update.")
         return
@@ -354,6 +436,8 @@ def update_file(todo_file):
     default=None,
 )
 def to_zit(todo_file):
+    from ted.data_types import from_md_file, proj_from_md_file
+
     if not os.path.isfile(todo_file):
         click.echo(f"File {todo_file} does not exist.")
         return
@@ -382,29 +466,49 @@ def to_zit(todo_file):
 
 @cli.command()
 @click.option("-s", "--show", is_flag=True, help="Show details for each todo")
-@click.option("-t", "--tag", is_flag=True, help="Filter todos by tags")
+@click.option(
+    "-t",
+    "--tag",
+    is_flag=False,
+    flag_value="",
+    default=None,
+    help="Group todos by tag, or filter with a query like 'work and not waiting'",
+)
 def ls(show, tag):
-    VAULT_DATA = VAULT.load_vault_data()
-    todos = VAULT_DATA.todos
-    tag_dict = {}
+    VAULT = get_vault()
+    source = VAULT.todo_listing()
+    statuses = source.resolve_statuses()
+
+    def details(todo) -> str:
+        from ted.data_types import from_md_file
+        from ted.mdparse import TodoSummary
+
+        if isinstance(todo, TodoSummary):
+            todo = from_md_file(todo.filepath)
+        return str(todo)
+
     if tag:
-        for todo in todos:
-            tags = todo.tags
-            for tag in tags:
-                t = tag_dict.get(tag, [])
-                t.append(todo)
-                tag_dict[tag] = t
-
-        for tag, tag_todos in tag_dict.items():
-            click.echo(f"Tag: {tag} - {len(tag_todos)} todos")
-            for todo in tag_todos:
-                status = todo._status().value
+        try:
+            matches = source.query_tags(tag)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="'--tag'")
+        click.echo(f"Tags: {tag} - {len(matches)} todos")
+        for todo in matches:
+            status = statuses[todo.filepath].value
+            click.echo(f"  {status} {todo.id}: {todo.name}")
+            if show:
+                click.echo(details(todo))
+    elif tag is not None:
+        for tag, count in source.tag_counts().items():
+            click.echo(f"Tag: {tag} - {count} todos")
+            for todo in source.todos_with_tag(tag):
+                status = statuses[todo.filepath].value
                 click.echo(f"  {status} {todo.id}: {todo.name}")
                 if show:
-                    click.echo(str(todo))
+                    click.echo(details(todo))
     else:
         file_paths = []
-        for todo in todos:
+        for todo in source.todos:
             relative_path = os.path.dirname(
                 os.path.relpath(todo.filepath, Config.TODO_DIR)
             )
@@ -416,17 +520,20 @@ def ls(show, tag):
             if relative_path != last_relative_path:
                 click.echo(f"\nDirectory: {relative_path}")
                 last_relative_path = relative_path
-            status = todo._status().value
+            status = statuses[todo.filepath].value
             click.echo(f"{status} {todo.id}: {todo.name}")
             if show:
-                click.echo(str(todo))
+                click.echo(details(todo))
 
 
 @cli.command()
 @click.argument("todo_id")
 def done(todo_id):
-    VAULT_DATA = VAULT.load_vault_data()
-    todo = VAULT_DATA.find("todos", todo_id)
+    from ted.atomic import VaultTransaction
+    from ted.utils import new_timestamp
+
+    VAULT = get_vault()
+    todo = VAULT.find("todos", todo_id)
 
     if not todo:
         click.echo(f"Todo with ID {todo.id} not found.")
@@ -444,9 +551,9 @@ def done(todo_id):
 
     todo.properties.completed = new_timestamp()
 
-    todo.write(Config.DONE_DIR)
-
-    os.remove(todo.filepath)
+    with VaultTransaction() as tx:
+        todo.write(Config.DONE_DIR, tx)
+        tx.remove(todo.filepath)
     click.echo(f"Todo {todo.id} marked as done and moved to done directory.")
 
 
@@ -457,6 +564,10 @@ def done(todo_id):
     default=None,
 )
 def done_file(todo_file):
+    from ted.atomic import VaultTransaction
+    from ted.data_types import from_md_file
+    from ted.utils import new_timestamp
+
     if not todo_file:
         click.echo("No todo file specified for update.")
     if not os.path.isfile(todo_file):
@@ -480,17 +591,17 @@ def done_file(todo_file):
 
     todo.properties.completed = new_timestamp()
 
-    todo.write(Config.DONE_DIR)
-
-    os.remove(todo.filepath)
+    with VaultTransaction() as tx:
+        todo.write(Config.DONE_DIR, tx)
+        tx.remove(todo.filepath)
     click.echo(f"Todo {todo.id} marked as done and moved to done directory.")
 
 
 @cli.command()
 @click.argument("todo_id")
 def show(todo_id):
-    VAULT_DATA = VAULT.load_vault_data()
-    todo = VAULT_DATA.find("todos", todo_id)
+    VAULT = get_vault()
+    todo = VAULT.find("todos", todo_id, include_done=True)
     if not todo:
         click.echo(f"Todo with ID {todo_id} not found.")
         return
@@ -504,6 +615,8 @@ def show(todo_id):
     default=None,
 )
 def show_file(todo_file):
+    from ted.data_types import from_md_file
+
     if not todo_file:
         click.echo("No todo file specified for update.")
     if not os.path.isfile(todo_file):
@@ -525,12 +638,14 @@ def show_file(todo_file):
     default=None,
 )
 def id(todo_file):
+    from ted.mdparse import read_md_header, summary_from_md
+
     if not todo_file:
         return
     if not os.path.isfile(todo_file):
         return
 
-    todo = from_md_file(todo_file)
+    todo = summary_from_md(read_md_header(todo_file), todo_file)
 
     if not todo:
         return
@@ -539,14 +654,39 @@ def id(todo_file):
 
 @cli.command()
 def status():
-    todos = VAULT.load_todos()
-    for todo in todos:
+    VAULT = get_vault()
+    source = VAULT.todo_listing()
+    statuses = source.resolve_statuses()
+    for todo in source.todos:
         try:
-            click.echo(todo.status(verbose=True))
+            click.echo(todo.status(verbose=True, statuses=statuses))
         except Exception as e:
             click.echo(f"Error reading {todo.filepath}: {e}")
 
 
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option("--done", is_flag=True, help="Include finished todos")
+@click.option("--project", "-p", help="Only todos whose project id contains this")
+@click.option("--limit", "-n", type=int, default=20, show_default=True)
+def search(query, done, project, limit):
+    """Full-text search over todos, projects and references."""
+    VAULT = get_vault()
+    index = VAULT.search_index()
+    kinds = {
+        "TodoData": "todo",
+        "done": "done",
+        "ProjectData": "project",
+        "ReferenceData": "ref",
+    }
+    results = index.search(" ".join(query), limit=limit, done=done, project=project)
+    if not results:
+        click.echo("No matches.")
+        return
+    for score, doc in results:
+        click.echo(f"[{kinds[doc['kind']]}] {doc['id']}: {doc['name']} ({score:.2f})")
+
+
 @cli.command()
 def init():
     """Initialize the TED vault directories."""
@@ -555,71 +695,330 @@ def init():
 
 
 @cli.command()
-def inbox():
+@click.option("--off", is_flag=True, help="Remove the snapshot, use the pickle cache")
+def snapshot(off):
+    """Keep the parsed vault in one memory-mapped snapshot file.
+
+    Once written, every command loads from the snapshot and refreshes it
+    incrementally when files change.
+    """
+    VAULT = get_vault()
+    if off:
+        VAULT.cache.disable_snapshot()
+        VAULT.cache.save()
+        click.echo("Snapshot removed.")
+        return
+    VAULT.cache.enable_snapshot()
+    VAULT.load_vault_data()
+    VAULT.cache.save()
+    stats = VAULT.cache.stats()
+    click.echo(
+        f"Wrote snapshot of {stats['entries']} files "
+        f"({stats['size'] / 1024:.1f} KiB) to {stats['file']}"
+    )
+
+
+@cli.group(name="cache")
+def cache_group():
+    """Manage the parsed vault cache."""
+    pass
+
+
+@cache_group.command(name="rebuild")
+def cache_rebuild():
+    """Drop the parse cache and re-parse the whole vault."""
+    VAULT = get_vault()
+    VAULT_DATA = VAULT.rebuild_cache()
+    total = (
+        len(VAULT_DATA.todos)
+        + len(VAULT_DATA.dones)
+        + len(VAULT_DATA.projects)
+        + len(VAULT_DATA.references)
+    )
+    click.echo(f"Rebuilt parse cache with {total} files.")
+
+
+@cache_group.command(name="stats")
+def cache_stats():
+    """Show parse cache statistics."""
+    VAULT = get_vault()
+    stats = VAULT.cache.stats()
+    click.echo(f"Cache file: {stats['file']}")
+    click.echo(f"Size: {stats['size'] / 1024:.1f} KiB")
+    click.echo(f"Entries: {stats['entries']}")
+    click.echo(f"Directory listings: {len(VAULT.listings.listings)}")
+    for kind, count in sorted(stats["kinds"].items()):
+        click.echo(f"  {kind}: {count}")
+
+
+@cli.group(name="index")
+def index_group():
+    """Manage the optional SQLite index used by ls, show, done and update."""
+
+
+@index_group.command(name="rebuild")
+def index_rebuild():
+    """Create the index, or rebuild it from the markdown files."""
+    VAULT = get_vault()
+    parsed, _ = VAULT.rebuild_index()
+    click.echo(f"Indexed {parsed} files into {CONFIG.INDEX_DB_FILE}.")
+
+
+@index_group.command(name="drop")
+def index_drop():
+    """Delete the index and go back to scanning the vault."""
+    VAULT = get_vault()
+    VAULT.drop_index()
+    click.echo("Index removed.")
+
+
+@index_group.command(name="stats")
+def index_stats():
+    """Show row counts of the index."""
+    VAULT = get_vault()
+    index = VAULT.index()
+    if index is None:
+        click.echo("No index. Create one with `ted index rebuild`.")
+        return
+    stats = index.stats()
+    click.echo(f"Index file: {stats['file']}")
+    click.echo(f"Size: {stats['size'] / 1024:.1f} KiB")
+    for table, count in stats["rows"].items():
+        click.echo(f"  {table}: {count}")
+
+
+@cli.command()
+@click.option("--dry-run", is_flag=True, help="Only report what would be removed")
+def gc(dry_run):
+    """Remove attachment blobs that no file in the vault refers to."""
+    from ted.blobs import BlobStore
+
+    store = BlobStore(CONFIG.BLOB_DIR)
+    count, size = store.gc([CONFIG.FILES_DIR, CONFIG.INBOX_DIR], dry_run=dry_run)
+    action = "Would remove" if dry_run else "Removed"
+    click.echo(f"{action} {count} unreferenced blobs ({size / 1024:.1f} KiB).")
+
+
+@cli.command()
+@click.option(
+    "--interval",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Seconds between checks of the vault for changes",
+)
+def daemon(interval):
+    """Keep the vault in memory and answer read-only commands over a socket."""
+    from ted.daemon import serve
+
+    try:
+        serve(CONFIG.DAEMON_SOCKET, interval=interval)
+    except RuntimeError as e:
+        click.echo(str(e))
+
+
+@cli.command()
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of attachments to download concurrently",
+)
+@click.option(
+    "--all",
+    "fetch_all",
+    is_flag=True,
+    help="Fetch every item on the server, ignoring the saved sync cursor",
+)
+def inbox(jobs, fetch_all):
     """Retrieve inbox items from the inbox server and save to local inbox directory."""
-    url = CONFIG.INBOX_SERVER_URL  # Assumes this is defined in Config
+    import json
+    import time
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    from ted.blobs import BlobStore
+    from ted.data_types import InboxItem
+    from ted.utils import download_file
+
+    jobs = max(1, jobs)
+    server_url = CONFIG.INBOX_SERVER_URL.rstrip("/")
     inbox_dir = CONFIG.INBOX_DIR  # Assumes this is defined in Config
 
-    url = url.rstrip("/") + "/api/items"
+    url = server_url + "/api/items"
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        if "application/json" not in response.headers.get("content-type", ""):
-            click.echo(
-                f"Server did not return JSON. Response: {response.text[:500]}..."
-            )
-            return
-        items = response.json()["items"]
+        with open(CONFIG.INBOX_CURSOR_FILE, "r") as f:
+            sync_states = json.load(f)
+    except (OSError, ValueError):
+        sync_states = {}
+    sync_state = {} if fetch_all else sync_states.get(server_url, {})
+    cursor = sync_state.get("cursor")
+    cursor_ns = int(cursor.partition(":")[0]) if cursor else -1
+    # Filenames already saved, with their cursor time, within the lookback.
+    seen = sync_state.get("seen", {})
+    etag = sync_state.get("etag")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=jobs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    params = {"limit": INBOX_PAGE_SIZE}
+    if cursor:
+        params["since"] = f"{max(cursor_ns - INBOX_LOOKBACK_NS, 0)}:"
+    headers = {"If-None-Match": etag} if etag else {}
+    fetched = []
+    pages = 0
+    try:
+        while True:
+            response = session.get(url, params=params, headers=headers)
+            if response.status_code == 304:
+                break
+            response.raise_for_status()
+            if "application/json" not in response.headers.get("content-type", ""):
+                click.echo(
+                    f"Server did not return JSON. Response: {response.text[:500]}..."
+                )
+                return
+            page = response.json()
+            fetched.extend(page["items"])
+            pages += 1
+            # Only a single page can be revalidated by the next poll.
+            etag = response.headers.get("ETag") if pages == 1 else None
+            if not page["has_more"]:
+                break
+            params["since"] = page["next_cursor"]
+            headers = {}
     except requests.RequestException as e:
         click.echo(f"Error fetching inbox items: {e}")
         return
-    except ValueError as e:
+    except (ValueError, KeyError) as e:
         click.echo(f"Invalid JSON received: {e}. Response: {response.text[:500]}...")
         return
 
+    items = [item for item in fetched if item["filename"] not in seen]
+    if items:
+        etag = None
+    else:
+        click.echo("No new inbox items.")
+
     os.makedirs(inbox_dir, exist_ok=True)
     photos_dir = os.path.join(inbox_dir, "photos")
     files_dir = os.path.join(inbox_dir, "files")
     os.makedirs(files_dir, exist_ok=True)
     os.makedirs(photos_dir, exist_ok=True)
 
-    for item in items:
-        filename, content = item["filename"], item["content"]
-        filepath = os.path.join(inbox_dir, filename)
-        filepath = filepath.replace(":", "_")  # Replace colons to avoid issues on some filesystems
-        inbox_item = InboxItem.model_validate_json(content)
-
-        # Download photo if it exists
-        if inbox_item.photo:
-            photo_url = (
-                CONFIG.INBOX_SERVER_URL.rstrip("/") + f"/uploads/{inbox_item.photo}"
-            )
-            dest_photo_path = os.path.join(photos_dir, inbox_item.photo)
+    store = BlobStore(CONFIG.BLOB_DIR)
+    inbox_items = []
+    downloads = []
+    # Attachments whose content another download in this run fetches.
+    waiting = []
+    downloading = set()
+    reused = 0
+    for index, item in enumerate(items):
+        inbox_item = InboxItem.model_validate(item["item"])
+        inbox_items.append(inbox_item)
+
+        attachments = [
+            ("photo", inbox_item.photo, inbox_item.photo_sha256, photos_dir),
+            ("file", inbox_item.file, inbox_item.file_sha256, files_dir),
+        ]
+        for kind, name, digest, dest_dir in attachments:
+            if not name:
+                continue
+            dest_path = os.path.join(dest_dir, name)
+            if store.has(digest):
+                store.link(digest, dest_path)
+                reused += 1
+                click.echo(f"Linked {kind} {name} from blob store")
+            elif digest and digest in downloading:
+                waiting.append((index, kind, name, dest_path, digest))
+            else:
+                downloads.append((index, kind, name, dest_path, digest))
+                if digest:
+                    downloading.add(digest)
+
+    start = time.perf_counter()
+    downloaded = 0
+    total_bytes = 0
+    failed = set()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(
+                download_file,
+                session,
+                f"{server_url}/uploads/{name}",
+                dest_path,
+                store,
+            ): (index, kind, name)
+            for index, kind, name, dest_path, _ in downloads
+        }
+        for future in as_completed(futures):
+            index, kind, name = futures[future]
             try:
-                photo_response = requests.get(photo_url)
-                photo_response.raise_for_status()
-                with open(dest_photo_path, "wb") as photo_file:
-                    photo_file.write(photo_response.content)
-                click.echo(f"Downloaded photo {inbox_item.photo}")
-            except requests.RequestException as e:
-                click.echo(f"Error downloading photo {inbox_item.photo}: {e}")
-        if inbox_item.file:
-            file_url = (
-                CONFIG.INBOX_SERVER_URL.rstrip("/") + f"/uploads/{inbox_item.file}"
+                total_bytes += future.result()
+                downloaded += 1
+                click.echo(f"Downloaded {kind} {name}")
+            except (requests.RequestException, OSError) as e:
+                failed.add(index)
+                click.echo(f"Error downloading {kind} {name}: {e}")
+    elapsed = time.perf_counter() - start
+    for index, kind, name, dest_path, digest in waiting:
+        try:
+            store.link(digest, dest_path)
+            reused += 1
+            click.echo(f"Linked {kind} {name} from blob store")
+        except OSError as e:
+            failed.add(index)
+            click.echo(f"Error linking {kind} {name}: {e}")
+    if downloads:
+        megabytes = total_bytes / (1024 * 1024)
+        click.echo(
+            f"Downloaded {downloaded}/{len(downloads)} attachments, "
+            f"{megabytes:.1f} MiB in {elapsed:.2f}s "
+            f"({megabytes / max(elapsed, 1e-9):.1f} MiB/s, {jobs} jobs)"
+        )
+    if reused:
+        click.echo(f"Reused {reused} attachments already in the blob store")
+
+    # Items are saved in server order up to the first one missing an
+    # attachment; it and everything after it are fetched again next time.
+    for index, (item, inbox_item) in enumerate(zip(items, inbox_items)):
+        if index in failed:
+            click.echo(
+                f"Stopped at inbox item {inbox_item.id}, "
+                "run ted inbox again to retry its attachments"
             )
-            dest_file_path = os.path.join(files_dir, inbox_item.file)
-            try:
-                file_response = requests.get(file_url)
-                file_response.raise_for_status()
-                with open(dest_file_path, "wb") as data_file:
-                    data_file.write(file_response.content)
-                click.echo(f"Downloaded file {inbox_item.file}")
-            except requests.RequestException as e:
-                click.echo(f"Error downloading file {inbox_item.file}: {e}")
+            break
+        filepath = os.path.join(inbox_dir, item["filename"])
+        filepath = filepath.replace(":", "_")  # Replace colons to avoid issues on some filesystems
         with open(filepath, "w") as f:
             f.write(str(inbox_item))
         click.echo(f"Saved inbox item {inbox_item.id} to {filepath}")
+        item_ns = int(item["cursor"].partition(":")[0])
+        seen[item["filename"]] = item_ns
+        if item_ns > cursor_ns:
+            cursor, cursor_ns = item["cursor"], item_ns
+    seen = {
+        filename: item_ns
+        for filename, item_ns in seen.items()
+        if item_ns >= cursor_ns - INBOX_LOOKBACK_NS
+    }
+
+    sync_states[server_url] = {"cursor": cursor, "seen": seen, "etag": etag}
+    os.makedirs(os.path.dirname(CONFIG.INBOX_CURSOR_FILE), exist_ok=True)
+    with open(CONFIG.INBOX_CURSOR_FILE, "w") as f:
+        json.dump(sync_states, f)
+
+    if failed:
+        return
+    if not items:
+        return
     clear_inbox = click.prompt(
         "Clear inbox on server? (y/n)",
         type=click.Choice(["y", "n"]),
@@ -627,8 +1026,8 @@ def inbox():
     )
     if clear_inbox == "y":
         try:
-            clear_url = CONFIG.INBOX_SERVER_URL.rstrip("/") + "/api/clear"
-            clear_response = requests.post(clear_url)
+            clear_url = server_url + "/api/clear"
+            clear_response = session.post(clear_url)
             clear_response.raise_for_status()
             click.echo("Inbox cleared on server.")
         except requests.RequestException as e:
@@ -636,8 +1035,28 @@ def inbox():
 
 
 def main():
+    if "--startup-profile" in sys.argv[1:]:
+        import atexit
+        from ted.profiling import ImportProfiler
+
+        profiler = ImportProfiler()
+        profiler.start()
+        atexit.register(profiler.report, _CLI_IMPORT_TIME)
+    elif not os.environ.get("TED_NO_DAEMON") and not os.environ.get("TED_PROFILE"):
+        from ted.daemon import forward
+
+        exit_code = forward(CONFIG.DAEMON_SOCKET, sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+    if os.path.exists(CONFIG.DAEMON_SOCKET):
+        from ted.daemon import notify_on_commit
+
+        notify_on_commit(CONFIG.DAEMON_SOCKET, sys.argv[1:])
     cli()
 
 
+_CLI_IMPORT_TIME = time.perf_counter() - _IMPORT_START
+
+
 if __name__ == "__main__":
     main()
@@ -9,7 +9,20 @@ class Config:
     PROJECTS_DIR = os.path.join(VAULT_DIR, "projects")
     FILES_DIR = os.path.join(VAULT_DIR, "files")
     INBOX_DIR = os.path.join(VAULT_DIR, "inbox")
-    INBOX_SERVER_URL = "http://serverin:5000"
+    BLOB_DIR = os.path.join(VAULT_DIR, ".blobs")
+    CACHE_DIR = os.path.join(VAULT_DIR, ".cache")
+    PARSE_CACHE_FILE = os.path.join(CACHE_DIR, "parse_cache.pkl")
+    SNAPSHOT_FILE = os.path.join(CACHE_DIR, "vault.snapshot")
+    LISTING_CACHE_FILE = os.path.join(CACHE_DIR, "listings.pkl")
+    DAEMON_SOCKET = os.path.join(CACHE_DIR, "daemon.sock")
+    INBOX_CURSOR_FILE = os.path.join(CACHE_DIR, "inbox_cursor.json")
+    SEARCH_INDEX_FILE = os.path.join(CACHE_DIR, "search_index.pkl")
+    # Created by `ted index rebuild`; lookups use it whenever it exists.
+    INDEX_DB_FILE = os.path.join(CACHE_DIR, "index.sqlite3")
+    INBOX_SERVER_URL = os.environ.get("TED_INBOX_SERVER_URL", "http://serverin:5000")
+    LOAD_WORKERS = int(os.environ.get("TED_LOAD_WORKERS", "1"))
+    # Validate every model while loading instead of only before writing.
+    STRICT = os.environ.get("TED_STRICT", "") not in ("", "0")
 
     @staticmethod
     def init():
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import socket
+import sys
+
+# Read-only commands that are safe to answer from the daemon's in-memory vault.
+FORWARDED_COMMANDS = {
+    "ls",
+    "show",
+    "status",
+    "id",
+    "show-file",
+    "to-zit",
+    "search",
+}
+# Seconds to wait for the daemon before running a command directly.
+FORWARD_TIMEOUT = 10.0
+
+log = logging.getLogger(__name__)
+
+
+def _request(socket_path: str, message: dict) -> dict | None:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(FORWARD_TIMEOUT)
+            client.connect(socket_path)
+            client.sendall(json.dumps(message).encode() + b"\n")
+            chunks = []
+            while chunk := client.recv(65536):
+                chunks.append(chunk)
+    except OSError:
+        return None
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError:
+        return None
+
+
+def forward(socket_path: str, args: list[str]) -> int | None:
+    """Run args on a running daemon; None means no daemon answered."""
+    if not args or args[0] not in FORWARDED_COMMANDS:
+        return None
+    if not os.path.exists(socket_path):
+        return None
+    response = _request(socket_path, {"args": args, "cwd": os.getcwd()})
+    if response is None:
+        return None
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stderr.write(response.get("stderr", ""))
+    return response.get("exit_code", 0)
+
+
+def notify(socket_path: str):
+    """Have a running daemon reload the vault before its next answer."""
+    if os.path.exists(socket_path):
+        _request(socket_path, {"notify": True})
+
+
+def notify_on_commit(socket_path: str, args: list[str]):
+    """Notify the daemon whenever the command in args commits vault writes."""
+    if args and args[0] in FORWARDED_COMMANDS:
+        return
+    from ted.atomic import on_commit
+
+    on_commit(lambda written, removed: notify(socket_path))
+
+
+def is_running(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def serve(socket_path: str, interval: float = 1.0):
+    """Load the vault once and answer forwarded commands until interrupted.
+
+    Writers notify the daemon after each commit (see notify_on_commit);
+    changes made outside ted are picked up by polling every interval.
+    """
+    import signal
+    import socketserver
+    import threading
+    import time
+
+    from click.testing import CliRunner
+
+    import ted.cli as cli_module
+    from ted.cache import is_racy, stat_key
+    from ted.vault import Vault
+
+    class DaemonVault(Vault):
+        """Vault that keeps VaultData in memory and reloads it on change."""
+
+        def __init__(self, config):
+            super().__init__(config)
+            # Held while reloading and while answering a command, so a
+            # command never sees a half-refreshed vault.
+            self.lock = threading.RLock()
+            self.racy = False
+            self.signature = self.scan()
+            self.data = super().load_vault_data()
+            self.search_signature = None
+
+        def scan(self) -> frozenset:
+            """Stat keys of every vault file; sets racy if a file changed too
+            recently for its stat key to show another write."""
+            checked_ns = time.time_ns()
+            entries = []
+            racy = False
+            for key in ("todos", "done", "projects", "ref"):
+                for _, _, full_path, st in self.get_files(self.required_dirs[key]):
+                    entries.append((full_path, stat_key(st)))
+                    racy = racy or is_racy(st, checked_ns)
+            self.listings.save()
+            self.racy = racy
+            return frozenset(entries)
+
+        def refresh(self) -> bool:
+            with self.lock:
+                was_racy = self.racy
+                signature = self.scan()
+                if signature == self.signature and not was_racy:
+                    return False
+                self.data = super().load_vault_data()
+                self.signature = signature
+                self.search_signature = None
+                self._index_synced = False
+                return True
+
+        def load_vault_data(self, **collections):
+            with self.lock:
+                return self.data
+
+        def todo_listing(self):
+            # The in-memory VaultData answers the same listing queries.
+            with self.lock:
+                return self.data
+
+        def search_index(self):
+            # Walk the vault again only after refresh() saw it change.
+            with self.lock:
+                if self.search_signature != self.signature:
+                    self._search_index = super().search_index()
+                    self.search_signature = self.signature
+                return self._search_index
+
+        def index(self):
+            with self.lock:
+                return super().index()
+
+    # CliRunner swaps sys.stderr while a command runs; log to the real one.
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+    vault = DaemonVault(cli_module.CONFIG)
+    cli_module._VAULT = vault
+    runner = CliRunner()
+    stop = threading.Event()
+
+    def watch():
+        while not stop.wait(interval):
+            try:
+                if vault.refresh():
+                    log.info("Vault changed, reloaded.")
+            except Exception:
+                log.exception("Error reloading vault")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+                if request.get("notify"):
+                    self.reload()
+                    return
+                args = list(request["args"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return
+            response = {"stdout": "", "stderr": "", "exit_code": 2}
+            if args and args[0] in FORWARDED_COMMANDS:
+                cwd = os.getcwd()
+                try:
+                    os.chdir(request.get("cwd") or cwd)
+                    with vault.lock:
+                        result = runner.invoke(cli_module.cli, args, prog_name="ted")
+                finally:
+                    os.chdir(cwd)
+                response = {
+                    "stdout": result.stdout,
+                    "stderr": result.stderr,
+                    "exit_code": result.exit_code,
+                }
+            self.wfile.write(json.dumps(response).encode())
+
+        def reload(self):
+            try:
+                refreshed = vault.refresh()
+            except Exception:
+                log.exception("Error reloading vault")
+                refreshed = False
+            if refreshed:
+                log.info("Vault changed by a ted command, reloaded.")
+            self.wfile.write(json.dumps({"refreshed": refreshed}).encode())
+
+    if os.path.exists(socket_path):
+        if is_running(socket_path):
+            raise RuntimeError(f"A ted daemon is already running on {socket_path}")
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        os.chmod(socket_path, 0o600)
+        log.info(f"ted daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            os.remove(socket_path)
+
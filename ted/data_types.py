@@ -1,11 +1,29 @@
 import os
 from datetime import datetime
+from typing import Any
 
 import yaml
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from enum import Enum
 
+from ted import profiling
+from ted.atomic import VaultTransaction, atomic_write
 from ted.config import Config
+from ted.mdparse import (
+    StatusSymbols,
+    TodoSummary,
+    _status_string,
+    list_items,
+    normalize_links,
+    parse_frontmatter,
+    parse_project_id,
+    parse_task_line,
+    plain_properties,
+    read_md_file,
+    section_lines,
+    task_status,
+    tokenize_md,
+)
 
 
 class ReferenceType(str, Enum):
@@ -14,13 +32,6 @@ class ReferenceType(str, Enum):
     FILE = "f"
 
 
-class StatusSymbols(str, Enum):
-    DONE = "✅"
-    NOT_DONE = "❌"
-    BLOCKED = "⛔"
-    WARNING = "⚠️"
-
-
 def new_timestamp():
     return datetime.now().strftime("%m-%d-%Y_%H:%M:%S")
 
@@ -39,7 +50,35 @@ def list2md(key: str, lst: list[str]):
 
 
 def id_to_int(id_str: str) -> int:
-    return int("".join(c for c in id_str if c.isdigit()))
+    return int("".join(filter(str.isdigit, id_str)))
+
+
+_object_setattr = object.__setattr__
+
+
+def _build(model_cls, **fields):
+    """Construct a model read from the vault, given every one of its fields.
+
+    The markdown parsers only produce values of the declared types, so bulk
+    loads skip pydantic validation unless Config.STRICT is set. This leaves
+    the model in the state model_construct() would, without its per-field
+    default lookup, which in pydantic 2 costs more than validating. Models
+    are validated in full before they are written back (see _checked_str).
+    """
+    if Config.STRICT:
+        return model_cls(**fields)
+    model = model_cls.__new__(model_cls)
+    _object_setattr(model, "__dict__", fields)
+    _object_setattr(model, "__pydantic_fields_set__", set(fields))
+    _object_setattr(model, "__pydantic_extra__", None)
+    _object_setattr(model, "__pydantic_private__", None)
+    return model
+
+
+def _checked_str(model: BaseModel) -> str:
+    """Validate a possibly unvalidated model and render it for writing."""
+    type(model).model_validate(model.model_dump(warnings=False))
+    return str(model)
 
 
 def inbox_from_md(file_content: str):
@@ -85,6 +124,8 @@ def inbox_from_md(file_content: str):
         id=metadata.get("id", ""),
         photo=metadata.get("photo", None),
         file=metadata.get("file", None),
+        photo_sha256=metadata.get("photo_sha256", None),
+        file_sha256=metadata.get("file_sha256", None),
     )
 
 
@@ -95,10 +136,16 @@ class InboxItem(BaseModel):
     id: str
     photo: str | None = None
     file: str | None = None
+    photo_sha256: str | None = None
+    file_sha256: str | None = None
 
     def __str__(self):
         photo_str = 'photo: "[[' + self.photo + ']]"\n' if self.photo else ""
         file_str = 'file: "[[' + self.file + ']]"\n' if self.file else ""
+        if self.photo_sha256:
+            photo_str += f"photo_sha256: {self.photo_sha256}\n"
+        if self.file_sha256:
+            file_str += f"file_sha256: {self.file_sha256}\n"
         return f"""---
 timestamp: {self.timestamp}
 id: {self.id}
@@ -120,13 +167,11 @@ class Task(BaseModel):
 
     @staticmethod
     def from_md(md_str: str) -> "Task":
-        done = md_str.startswith("- [x] ")
-        description = md_str[6:].strip()
-        return Task(done=done, description=description)
+        done, description = parse_task_line(md_str)
+        return _build(Task, done=done, description=description)
 
     def status(self) -> str:
-        status = StatusSymbols.DONE.value if self.done else StatusSymbols.NOT_DONE.value
-        return status + f" {self.description}"
+        return task_status(self.done, self.description)
 
     def mark_done(self):
         self.done = True
@@ -199,10 +244,12 @@ class ReferenceData(BaseModel):
         _str += string2md("TLDR", self.tldr)
         return _str
 
-    def write(self, vault_dir: str):
+    def write(self, vault_dir: str, tx: VaultTransaction | None = None):
         file_dir = os.path.join(vault_dir, self.filename)
-        with open(file_dir, "w", encoding="utf-8") as f:
-            f.write(str(self))
+        if tx is not None:
+            tx.write(file_dir, _checked_str(self))
+        else:
+            atomic_write(file_dir, _checked_str(self))
 
     @property
     def id(self):
@@ -241,27 +288,45 @@ class TodoData(BaseModel):
     def tags(self) -> list[str]:
         return self.properties.tags
 
+    @property
+    def blocked_by(self) -> list[str]:
+        return self.properties.blocked_by or []
+
     def is_completed(self) -> bool:
         return all([t.done for t in self.tasks])
 
-    def write(self, vault_dir: str):
+    def write(self, vault_dir: str, tx: VaultTransaction | None = None):
         file_dir = os.path.join(vault_dir, self.filename)
-        with open(file_dir, "w", encoding="utf-8") as f:
-            f.write(str(self))
+        if tx is not None:
+            tx.write(file_dir, _checked_str(self))
+        else:
+            atomic_write(file_dir, _checked_str(self))
 
-    def save(self):
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            f.write(str(self))
+    def save(self, tx: VaultTransaction | None = None):
+        if tx is not None:
+            tx.write(self.filepath, _checked_str(self))
+        else:
+            atomic_write(self.filepath, _checked_str(self))
+
+    def _status(
+        self,
+        statuses: dict[str, StatusSymbols] | None = None,
+        _seen: frozenset[str] = frozenset(),
+    ) -> StatusSymbols:
+        if statuses is not None and self.filepath in statuses:
+            return statuses[self.filepath]
 
-    def _status(self) -> StatusSymbols:
         if self.properties.blocked_by is not None:
+            seen = _seen | {self.filename}
             for t in self.properties.blocked_by:
+                if t in seen:
+                    return StatusSymbols.BLOCKED
                 if os.path.exists(os.path.join(Config.TODO_DIR, t)) is False:
                     continue
                 status = from_md_file(os.path.join(Config.TODO_DIR, t))
                 if not status:
                     continue
-                if status._status() != StatusSymbols.DONE:
+                if status._status(_seen=seen) != StatusSymbols.DONE:
                     return StatusSymbols.BLOCKED
 
         if self.is_completed():
@@ -269,17 +334,10 @@ class TodoData(BaseModel):
         else:
             return StatusSymbols.NOT_DONE
 
-    def status(self, verbose=False) -> str:
-        status = self._status().value
-
-        status_string = f"{self.id}: {self.name} {status}"
-
-        if not verbose:
-            return status_string
-        status_string += "\nTasks:\n"
-        for i, t in enumerate(self.tasks):
-            status_string += f" {i}. " + t.status() + "\n"
-        return status_string
+    def status(
+        self, verbose=False, statuses: dict[str, StatusSymbols] | None = None
+    ) -> str:
+        return _status_string(self, self._status(statuses), verbose)
 
     def add_info(self, info_str: str):
         self.info.append(info_str)
@@ -324,98 +382,307 @@ class ProjectData(BaseModel):
         _str += list2md("info", self.info)
         return _str
 
-    def write(self, vault_dir: str) -> None:
+    def write(self, vault_dir: str, tx: VaultTransaction | None = None) -> None:
         file_dir = os.path.join(vault_dir, self.filename)
-        with open(file_dir, "w", encoding="utf8") as f:
-            f.write(self.__str__())
+        if tx is not None:
+            tx.write(file_dir, _checked_str(self))
+        else:
+            atomic_write(file_dir, _checked_str(self))
+
+
+DATA_TYPES = ("todos", "projects", "references")
 
 
-class VaultData(BaseModel):
+class TodoQueries:
+    """Listing queries over self.todos, shared by VaultData, TodoListing and
+    SqlIndex.
+
+    Todos need filepath, filename, tags, blocked_by and is_completed(), as
+    both TodoData and TodoSummary have.
+    """
+
+    def _tag_index(self) -> dict[str, set[str]]:
+        """Filenames of open todos by tag; override to reuse a prebuilt one."""
+        by_tag: dict[str, set[str]] = {}
+        for todo in self.todos:
+            for tag in todo.tags:
+                by_tag.setdefault(tag, set()).add(todo.filename)
+        return by_tag
+
+    def _todo_dir(self) -> str | None:
+        """Directory blocked_by entries are relative to; None for TODO_DIR."""
+        return None
+
+    def resolve_statuses(self) -> dict[str, StatusSymbols]:
+        """Resolve the status of every todo from the blocked_by graph at once.
+
+        Blockers that are not open todos (done or missing) are ignored, like
+        in TodoData._status. Todos on a blocked_by cycle are BLOCKED.
+        """
+        with profiling.phase("statuses"):
+            return todo_statuses(
+                (
+                    (todo.filepath, todo.blocked_by, todo.is_completed())
+                    for todo in self.todos
+                ),
+                self._todo_dir(),
+            )
+
+    def tag_counts(self) -> dict[str, int]:
+        """Number of open todos per tag."""
+        return {tag: len(posting) for tag, posting in self._tag_index().items()}
+
+    def todos_with_tag(self, tag: str) -> list:
+        return self.todos_by_filename(self._tag_index().get(tag, ()))
+
+    def todos_by_filename(self, filenames) -> list:
+        """Open todos for the given filenames, in listing order."""
+        filenames = set(filenames)
+        return [todo for todo in self.todos if todo.filename in filenames]
+
+    def query_tags(self, query: str) -> list:
+        """Open todos matching a boolean tag query like 'work and not waiting'."""
+        from ted.tags import evaluate_tag_query, parse_tag_query
+
+        universe = {todo.filename for todo in self.todos}
+        by_tag = self._tag_index()
+        matches = evaluate_tag_query(parse_tag_query(query), by_tag, universe)
+        return self.todos_by_filename(matches)
+
+
+class TodoListing(TodoQueries):
+    """Open todos as TodoSummary records, with VaultData's listing queries."""
+
+    def __init__(self, todos: list[TodoSummary]):
+        self.todos = todos
+        self._by_tag = super()._tag_index()
+
+    def _tag_index(self) -> dict[str, set[str]]:
+        return self._by_tag
+
+
+def todo_statuses(todos, todo_dir: str | None = None) -> dict[str, StatusSymbols]:
+    """Statuses of open todos by filepath, from (filepath, blocked_by,
+    is_completed) tuples.
+
+    Like TodoData._status, a blocked_by entry names a path relative to
+    todo_dir (default Config.TODO_DIR), so a todo in a subdirectory only
+    blocks others that name it with that subdirectory.
+    """
+    prefix = os.path.join(todo_dir or Config.TODO_DIR, "")
+    blockers: dict[str, list[str]] = {}
+    completed = set()
+    filepaths = {}
+    for filepath, blocked_by, is_completed in todos:
+        key = filepath[len(prefix) :] if filepath.startswith(prefix) else filepath
+        blockers[key] = blocked_by
+        filepaths[key] = filepath
+        if is_completed:
+            completed.add(key)
+    statuses = resolve_status_graph(blockers, completed)
+    return {filepaths[key]: status for key, status in statuses.items()}
+
+
+def resolve_status_graph(
+    blockers: dict[str, list[str]], completed: set[str]
+) -> dict[str, StatusSymbols]:
+    """Resolve the status of every todo in blockers at once.
+
+    Blockers that are not keys of blockers (done or missing todos) are
+    ignored, like in TodoData._status. Todos on a blocked_by cycle are
+    BLOCKED; the rest are DONE if their key is in completed.
+    """
+    statuses: dict[str, StatusSymbols] = {}
+    visiting: set[str] = set()
+
+    for root in blockers:
+        if root in statuses:
+            continue
+        visiting.add(root)
+        stack = [(root, iter(blockers[root]))]
+        while stack:
+            name, pending = stack[-1]
+            for dep in pending:
+                if dep in blockers and dep not in statuses and dep not in visiting:
+                    visiting.add(dep)
+                    stack.append((dep, iter(blockers[dep])))
+                    break
+            else:
+                stack.pop()
+                blocked = any(
+                    dep in blockers
+                    and (dep in visiting or statuses[dep] != StatusSymbols.DONE)
+                    for dep in blockers[name]
+                )
+                visiting.discard(name)
+                if blocked:
+                    statuses[name] = StatusSymbols.BLOCKED
+                elif name in completed:
+                    statuses[name] = StatusSymbols.DONE
+                else:
+                    statuses[name] = StatusSymbols.NOT_DONE
+    return statuses
+
+
+class VaultData(TodoQueries, BaseModel):
     todos: list[TodoData] = []
     dones: list[TodoData] = []
     projects: list[ProjectData] = []
     references: list[ReferenceData] = []
 
+    _by_int: dict[str, dict[int, Any]] = PrivateAttr(default_factory=dict)
+    _by_id: dict[str, dict[str, Any]] = PrivateAttr(default_factory=dict)
+    _by_filename: dict[str, dict[str, Any]] = PrivateAttr(default_factory=dict)
+    _max_ids: dict[str, int] = PrivateAttr(default_factory=dict)
+    _by_tag: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+
     def get_ids(self) -> dict[str, list[str]]:
         ids = {
             "todos": [todo.id for todo in self.todos + self.dones],
             "projects": [proj.id for proj in self.projects],
-            "references": [ref.task for ref in self.references],
+            "references": [ref.id for ref in self.references],
         }
         return ids
 
+    def model_post_init(self, __context) -> None:
+        self.build_index()
+
+    def build_index(self) -> None:
+        """Index every item by numeric id, full id and filename."""
+        # Private attributes go through pydantic's __getattr__, so the
+        # indexes are filled as locals and assigned once.
+        by_int, by_id, by_filename, max_ids = {}, {}, {}, {}
+        collections = (
+            ("todos", self.todos),
+            ("dones", self.dones),
+            ("projects", self.projects),
+            ("references", self.references),
+        )
+        for data_type, items in collections:
+            ints: dict[int, Any] = {}
+            ids: dict[str, Any] = {}
+            filenames: dict[str, Any] = {}
+            max_id = 0
+            # First item wins on duplicates, matching the old linear scan order.
+            for item in items:
+                item_id = item.id
+                ids.setdefault(item_id, item)
+                filenames.setdefault(item.filename, item)
+                try:
+                    item_id_int = id_to_int(item_id)
+                except ValueError:
+                    continue
+                ints.setdefault(item_id_int, item)
+                if item_id_int > max_id:
+                    max_id = item_id_int
+            by_int[data_type] = ints
+            by_id[data_type] = ids
+            by_filename[data_type] = filenames
+            max_ids[data_type] = max_id
+
+        by_tag: dict[str, set[str]] = {}
+        for todo in self.todos:
+            for tag in todo.tags:
+                by_tag.setdefault(tag, set()).add(todo.filename)
+
+        self._by_int = by_int
+        self._by_id = by_id
+        self._by_filename = by_filename
+        self._max_ids = max_ids
+        self._by_tag = by_tag
+
+    def _tag_index(self) -> dict[str, set[str]]:
+        return self._by_tag
+
     def get_next_id(self, data_type: str) -> int:
-        existing_ids = self.get_ids().get(data_type, [])
-        stripped_ids = [id_to_int(id) for id in existing_ids]
-        next_id = max(stripped_ids, default=0) + 1
-        return next_id
-
-    def find(self, data_type: str, item_id: str):
-        item_id_int = id_to_int(item_id)
-        items: list = []
+        max_id = self._max_ids.get(data_type, 0)
         if data_type == "todos":
-            items = self.todos + self.dones
-        elif data_type == "projects":
-            items = self.projects
-        elif data_type == "references":
-            items = self.references
-        else:
-            raise ValueError(f"Unknown data type: {data_type}")
+            max_id = max(max_id, self._max_ids.get("dones", 0))
+        return max_id + 1
 
-        for i in items:
-            if id_to_int(i.id) == item_id_int:
-                return i
-        return None
+    def find(self, data_type: str, item_id: str, include_done: bool = True):
+        """Find an item by id, filename or numeric id.
 
+        For "todos", open todos are searched first and done ones only if
+        include_done is set and no open todo matches.
+        """
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"Unknown data type: {data_type}")
 
-def parse_project_id(proj_str: str | None) -> str | None:
-    if proj_str is None:
-        return None
-    proj_str = proj_str.strip()
-    proj_str = proj_str.replace("[[", "").replace("]]", "")
-    return proj_str
+        item = self._find(data_type, item_id)
+        if item is None and data_type == "todos" and include_done:
+            item = self._find("dones", item_id)
+        return item
+
+    def _find(self, key: str, item_id: str):
+        item = self._by_id[key].get(item_id)
+        if item is None:
+            item = self._by_filename[key].get(item_id)
+        if item is None:
+            item = self._by_int[key].get(id_to_int(item_id))
+        return item
+
+
+_PROPERTY_FIELDS = frozenset(Properties.model_fields)
+
+
+def build_properties(properties: dict) -> Properties:
+    normalize_links(properties)
+    if Config.STRICT or not plain_properties(properties):
+        return Properties(**properties)
+    model = _build(
+        Properties,
+        created=properties["created"],
+        id=properties["id"],
+        completed=properties.get("completed"),
+        project_id=properties["project_id"],
+        tags=properties.get("tags", []),
+        others=properties.get("others", {}),
+        blocked_by=properties.get("blocked_by"),
+        info=properties.get("info", ""),
+    )
+    _object_setattr(
+        model, "__pydantic_fields_set__", set(properties).intersection(_PROPERTY_FIELDS)
+    )
+    return model
 
 
 def parse_properties(prop_str: str) -> Properties:
-    properties = yaml.safe_load(prop_str.split("---\n")[1])
-    properties["project_id"] = parse_project_id(properties.get("project_id"))
-
-    if "blocked_by" in properties and properties["blocked_by"] is not None:
-        properties["blocked_by"] = [
-            parse_project_id(item) for item in properties["blocked_by"]
-        ]
-    return Properties(**properties)
+    return build_properties(parse_frontmatter(prop_str.split("---\n")[1]))
 
 
 def from_md_file(filepath: str) -> TodoData | None:
-    with open(filepath, "r") as f:
-        text = f.read()
-    try:
-        parts = text.split("# ")
-        if parts[0] != "":
-            try:
-                properties = parse_properties(parts[0])
-            except Exception as e:
-                print(f"Error parsing properties in todo file {filepath}: {e}")
-                return None
-        else:
-            raise ValueError("Invalid todo file format: missing properties section.")
-        name, goal = parts[1].split("\n")[:2]
+    return todo_from_md(read_md_file(filepath), filepath)
 
-        tasks = [Task.from_md(p) for p in parts[2].split("\n") if p.startswith("- [")]
 
-        if len(parts) < 4:
-            info = []
-        else:
-            info = [p[2:] for p in parts[3].split("\n") if p.startswith("- ")]
-        note = "#".join(parts[4:]).strip() if len(parts) > 4 else ""
-        if note.startswith("note"):
-            note = note[5:].strip()
+def todo_from_md(text: str, filepath: str) -> TodoData | None:
+    try:
+        frontmatter, sections = tokenize_md(text, raw_section=3)
+        if frontmatter is None:
+            raise ValueError("Invalid todo file format: missing properties section.")
+        try:
+            properties = build_properties(parse_frontmatter(frontmatter))
+        except Exception as e:
+            print(f"Error parsing properties in todo file {filepath}: {e}")
+            return None
+        if not sections:
+            raise ValueError("Invalid todo file format: missing name section.")
+
+        name = sections[0][0]
+        goal = "\n".join(sections[0][1]).strip()
+        tasks = [
+            Task.from_md(line)
+            for line in section_lines(sections, 1)
+            if line.startswith("- [")
+        ]
+        info = list_items(section_lines(sections, 2))
+        note = sections[3][1].strip() if len(sections) > 3 else ""
         filename = os.path.basename(filepath)
 
-        return TodoData(
+        return _build(
+            TodoData,
             name=name,
-            goal=goal.strip(),
+            goal=goal,
             filename=filename,
             filepath=filepath,
             tasks=tasks,
@@ -429,72 +696,80 @@ def from_md_file(filepath: str) -> TodoData | None:
 
 
 def ref_from_md_file(filename: str):
-    with open(filename, "r") as f:
-        text = f.read()
+    return ref_from_md(read_md_file(filename), filename)
 
-    parts = text.split("# ")
 
-    if parts[0] != "":
-        properties = parse_properties(parts[0])
+def ref_from_md(text: str, filename: str):
+    frontmatter, sections = tokenize_md(text, raw_section=2)
+
+    if frontmatter is not None:
+        properties = build_properties(parse_frontmatter(frontmatter))
     else:
         raise ValueError("Invalid reference file format: missing properties section.")
+    if not sections:
+        raise ValueError("Invalid reference file format: missing name section.")
 
-    name, ref = parts[1].split("\n")[:2]
+    name = sections[0][0]
+    ref = sections[0][1][0] if sections[0][1] else ""
     if ref.startswith("[link]("):
         ref_content = ref[len("[link](") : -1]
-        ref_obj = Reference(type=ReferenceType.LINK, content=ref_content)
+        ref_obj = _build(Reference, type=ReferenceType.LINK, content=ref_content)
     elif ref.startswith("Notebook: "):
         ref_content = ref[len("Notebook: ") :]
-        ref_obj = Reference(type=ReferenceType.NOTEBOOK, content=ref_content)
+        ref_obj = _build(Reference, type=ReferenceType.NOTEBOOK, content=ref_content)
     elif ref.startswith("File: [[") and ref.endswith("]]"):
         ref_content = ref[len("File: [[") : -2]
-        ref_obj = Reference(type=ReferenceType.FILE, content=ref_content)
+        ref_obj = _build(Reference, type=ReferenceType.FILE, content=ref_content)
     else:
         raise ValueError("Invalid reference file format: unknown reference type.")
 
-    task = parts[2].split("\n")[1].strip()
-
-    task_id = parse_project_id(task)
-    if task_id is None:
+    task_lines = section_lines(sections, 1)
+    task_id = parse_project_id(task_lines[0]) if task_lines else None
+    if not task_id:
         raise ValueError("Invalid reference file format: missing task reference.")
+    tldr = sections[2][1].strip() if len(sections) > 2 else ""
 
     filename = os.path.basename(filename)
 
-    return ReferenceData(
+    return _build(
+        ReferenceData,
         name=name,
         ref=ref_obj,
         properties=properties,
         filename=filename,
         task=task_id,
+        tldr=tldr,
     )
 
 
 def proj_from_md_file(filename: str):
-    with open(filename, "r") as f:
-        text = f.read()
+    return proj_from_md(read_md_file(filename), filename)
+
 
-    parts = text.split("# ")
+def proj_from_md(text: str, filename: str):
+    frontmatter, sections = tokenize_md(text)
 
-    if parts[0] != "":
-        properties = parse_properties(parts[0])
+    if frontmatter is not None:
+        properties = build_properties(parse_frontmatter(frontmatter))
     else:
         raise ValueError("Invalid project file format: missing properties section.")
+    if not sections:
+        raise ValueError("Invalid project file format: missing name section.")
 
-    name, description = parts[1].split("\n")[:2]
+    name = sections[0][0]
+    description = "\n".join(sections[0][1])
     if ":" in name:
         shorthand, name = name.split(":", 1)
         shorthand = shorthand.strip()
         name = name.strip()
     else:
         shorthand = ""
-    if len(parts) < 3:
-        info = []
-    else:
-        info = [p[2:] for p in parts[2].split("\n") if p.startswith("- ")]
+    info = list_items(section_lines(sections, 1))
 
     filename = os.path.basename(filename)
 
-    return ProjectData(
+    return _build(
+        ProjectData,
         id=properties.id,
         name=name,
         shorthand=shorthand,
@@ -503,3 +778,12 @@ def proj_from_md_file(filename: str):
         filename=filename,
         info=info,
     )
+
+
+# Vault directory key -> parser for the files under it.
+PARSERS = {
+    "todos": todo_from_md,
+    "done": todo_from_md,
+    "projects": proj_from_md,
+    "ref": ref_from_md,
+}
@@ -0,0 +1,30 @@
+"""Gunicorn settings for running the inbox server with several workers.
+
+    gunicorn -c python:ted.gunicorn_conf ted.app:app
+
+Workers are separate processes that share the inbox and upload
+directories: items get ULID ids and are created with create_exclusive, and
+each worker rescans the inbox when the directory mtime shows another
+worker's write. Threads within a worker share its InboxIndex, which is
+locked.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("TED_SERVER_BIND", "0.0.0.0:5000")
+workers = int(
+    os.environ.get("TED_SERVER_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8))
+)
+worker_class = "gthread"
+threads = int(os.environ.get("TED_SERVER_THREADS", "4"))
+# Large uploads are streamed in a single request.
+timeout = int(os.environ.get("TED_SERVER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Restart workers now and then so a leak cannot grow without bound.
+max_requests = 10000
+max_requests_jitter = 1000
+# Import the app in each worker, so every worker builds its own InboxIndex.
+preload_app = False
+accesslog = "-"
@@ -0,0 +1,364 @@
+"""Scanning of vault markdown files without pydantic or YAML.
+
+Everything `ted id` and the header-only listing path need lives here, so
+they do not pay for importing the models in ted.data_types. YAML is only
+imported for frontmatter outside the flat shape ted writes.
+"""
+
+import os
+import re
+from enum import Enum
+from typing import NamedTuple
+
+from ted import profiling
+from ted.config import Config
+
+
+class StatusSymbols(str, Enum):
+    DONE = "✅"
+    NOT_DONE = "❌"
+    BLOCKED = "⛔"
+    WARNING = "⚠️"
+
+
+def parse_project_id(proj_str: str | None) -> str | None:
+    if proj_str is None:
+        return None
+    proj_str = proj_str.strip()
+    proj_str = proj_str.replace("[[", "").replace("]]", "")
+    return proj_str
+
+
+def parse_task_line(line: str) -> tuple[bool, str]:
+    """(done, description) of a "- [ ] ..." or "- [x] ..." line."""
+    return line.startswith("- [x] "), line[6:].strip()
+
+
+def task_status(done: bool, description: str) -> str:
+    status = StatusSymbols.DONE.value if done else StatusSymbols.NOT_DONE.value
+    return status + f" {description}"
+
+
+def _status_string(todo, status: StatusSymbols, verbose: bool) -> str:
+    status_string = f"{todo.id}: {todo.name} {status.value}"
+
+    if not verbose:
+        return status_string
+    status_string += "\nTasks:\n"
+    for i, t in enumerate(todo.tasks):
+        status_string += f" {i}. " + t.status() + "\n"
+    return status_string
+
+
+_PLAIN_INDICATORS = set("-?:,[]{}#&*!|>'\"%@`")
+# Plain scalars YAML may load as something other than a string: a superset
+# of PyYAML's implicit resolvers for ints, floats, timestamps, bools, nulls,
+# merge and value keys. Anything matching goes through YAML itself.
+_NOT_STR_RE = re.compile(
+    r"""
+    [-+]?[0-9_]*\.?[0-9_]*(?:[eE][-+]?[0-9]+)?
+    |[-+]?0b[0-1_]+|[-+]?0x[0-9a-fA-F_]+
+    |[-+]?[0-9][0-9_]*(?::[0-5]?[0-9])+(?:\.[0-9_]*)?
+    |[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN)
+    |[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}(?:[Tt \t].*)?
+    |yes|Yes|YES|no|No|NO|true|True|TRUE|false|False|FALSE|on|On|ON|off|Off|OFF
+    |null|Null|NULL|~|<<|=
+    """,
+    re.VERBOSE,
+)
+
+
+class _NotFlat(Exception):
+    """Frontmatter is outside the shape Properties.__str__ emits."""
+
+
+def _fast_scalar(value: str):
+    if value == "" or value == "null" or value == "~":
+        return None
+    if value == "[]":
+        return []
+    if value[0] == "'":
+        inner = value[1:-1]
+        if len(value) < 2 or value[-1] != "'" or "'" in inner.replace("''", ""):
+            raise _NotFlat()
+        return inner.replace("''", "'")
+    if value[0] in _PLAIN_INDICATORS or value[-1] == ":":
+        raise _NotFlat()
+    if ": " in value or " #" in value:
+        raise _NotFlat()
+    if _NOT_STR_RE.fullmatch(value):
+        raise _NotFlat()
+    return value
+
+
+def _fast_frontmatter(text: str) -> dict:
+    result: dict = {}
+    list_key = None
+    for line in text.splitlines():
+        if not line or line[0] in " \t#":
+            raise _NotFlat()
+        if line.startswith("- "):
+            if list_key is None:
+                raise _NotFlat()
+            if result[list_key] is None:
+                result[list_key] = []
+            result[list_key].append(_fast_scalar(line[2:].strip()))
+            continue
+        key, sep, value = line.partition(":")
+        if not sep or not key.isidentifier() or (value and value[0] != " "):
+            raise _NotFlat()
+        value = value.strip()
+        if value:
+            result[key] = _fast_scalar(value)
+            list_key = None
+        else:
+            result[key] = None
+            list_key = key
+    return result
+
+
+def parse_frontmatter(text: str) -> dict:
+    """Parse flat frontmatter, falling back to YAML for anything unusual."""
+    if profiling.ACTIVE is None:
+        return _parse_frontmatter(text)
+    with profiling.ACTIVE.phase("frontmatter"):
+        return _parse_frontmatter(text)
+
+
+def _parse_frontmatter(text: str) -> dict:
+    try:
+        return _fast_frontmatter(text)
+    except _NotFlat:
+        pass
+    profiling.count("yaml_calls")
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    try:
+        return yaml.load(text, Loader=loader) or {}
+    except yaml.YAMLError:
+        if loader is yaml.SafeLoader:
+            raise
+    return yaml.safe_load(text) or {}
+
+
+_OPTIONAL_STR_PROPERTIES = ("completed", "project_id")
+
+
+def normalize_links(properties: dict) -> dict:
+    """Strip the [[...]] around project_id and blocked_by entries."""
+    properties["project_id"] = parse_project_id(properties.get("project_id"))
+
+    if "blocked_by" in properties and properties["blocked_by"] is not None:
+        properties["blocked_by"] = [
+            parse_project_id(item) for item in properties["blocked_by"]
+        ]
+    return properties
+
+
+def plain_properties(properties: dict) -> bool:
+    """Whether properties already have the types validation would produce."""
+    if type(properties.get("created")) is not str:
+        return False
+    if type(properties.get("id")) is not str:
+        return False
+    for key in _OPTIONAL_STR_PROPERTIES:
+        value = properties.get(key)
+        if value is not None and type(value) is not str:
+            return False
+    if type(properties.get("info", "")) is not str:
+        return False
+    if type(properties.get("others", {})) is not dict:
+        return False
+    for key in ("tags", "blocked_by"):
+        value = properties.get(key, [])
+        if value is None and key == "blocked_by":
+            continue
+        if type(value) is not list or any(type(v) is not str for v in value):
+            return False
+    return True
+
+
+def tokenize_md(
+    text: str, raw_section: int | None = None
+) -> tuple[str | None, list[tuple[str, list[str] | str]]]:
+    """Walk a vault markdown file once, line by line.
+
+    Returns the frontmatter text (None if missing) and a list of
+    (heading, lines) sections, where only lines starting with "# " open a
+    section. Section number raw_section is returned as the untouched rest of
+    the file instead of a list of lines, so headings inside notes stay put.
+    """
+    end = len(text)
+    pos = 0
+    frontmatter = None
+    if text.startswith("---\n"):
+        close = text.find("\n---", 3)
+        after = close + 4
+        if close != -1 and (after == end or text[after] == "\n"):
+            frontmatter = text[4 : close + 1]
+            pos = after + 1
+
+    sections: list[tuple[str, list[str] | str]] = []
+    lines: list[str] | None = None
+    while pos < end:
+        nl = text.find("\n", pos)
+        if nl == -1:
+            nl = end
+        if text.startswith("# ", pos):
+            heading = text[pos + 2 : nl]
+            if len(sections) == raw_section:
+                sections.append((heading, text[nl + 1 :]))
+                break
+            lines = []
+            sections.append((heading, lines))
+        elif lines is not None:
+            lines.append(text[pos:nl])
+        pos = nl + 1
+    return frontmatter, sections
+
+
+def section_lines(sections: list, index: int) -> list[str]:
+    if index >= len(sections):
+        return []
+    return sections[index][1]
+
+
+def list_items(lines: list[str]) -> list[str]:
+    return [line[2:] for line in lines if line.startswith("- ")]
+
+
+def read_md_file(filepath: str) -> str:
+    with open(filepath, "r") as f:
+        return f.read()
+
+
+# read_md_header reads this much first and doubles it until the tasks
+# section has ended.
+HEADER_READ_SIZE = 4096
+
+
+def _header_end(data: bytes) -> int | None:
+    """Offset of the section after the tasks, as tokenize_md would split
+    data; None if data does not reach that far yet."""
+    pos = 0
+    if data.startswith(b"---\n") or data.startswith(b"---\r\n"):
+        close = data.find(b"\n---", 3)
+        if close == -1:
+            return None
+        after = close + 4
+        if data.startswith(b"\r", after):
+            after += 1
+        if after == len(data):
+            return None
+        if data[after] == ord("\n"):
+            pos = after + 1
+    headings = 0
+    while True:
+        if not data.startswith(b"# ", pos):
+            pos = data.find(b"\n# ", pos)
+            if pos == -1:
+                return None
+            pos += 1
+        headings += 1
+        if headings == 3:
+            return pos
+        pos = data.find(b"\n", pos)
+        if pos == -1:
+            return None
+        pos += 1
+
+
+def read_md_header(filepath: str) -> str:
+    """Read a todo file only up to the end of its tasks section.
+
+    Info logs and notes come after the tasks, so listing a todo costs
+    about the same however long those have grown. Line endings are
+    normalized like read_md_file's text mode does.
+    """
+    with open(filepath, "rb") as f:
+        data = f.read(HEADER_READ_SIZE)
+        while True:
+            end = _header_end(data)
+            if end is not None:
+                data = data[:end]
+                break
+            chunk = f.read(len(data))
+            if not chunk:
+                break
+            data += chunk
+    text = data.decode()
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+class TaskSummary(NamedTuple):
+    """A task as listed by TodoSummary; quacks like data_types.Task."""
+
+    done: bool
+    description: str
+
+    def status(self) -> str:
+        return task_status(self.done, self.description)
+
+
+class TodoSummary(NamedTuple):
+    """The parts of an open todo that listing commands need.
+
+    Everything up to the end of the tasks section; see read_md_header.
+    """
+
+    id: str
+    name: str
+    filename: str
+    filepath: str
+    tags: list[str]
+    blocked_by: list[str]
+    tasks: list[TaskSummary]
+
+    def is_completed(self) -> bool:
+        return all(task.done for task in self.tasks)
+
+    def status(
+        self, verbose=False, statuses: dict[str, StatusSymbols] | None = None
+    ) -> str:
+        """Like TodoData.status; statuses must contain this todo."""
+        return _status_string(self, statuses[self.filepath], verbose)
+
+
+def summary_from_md(text: str, filepath: str) -> TodoSummary | None:
+    """Parse a TodoSummary from a todo file or its header."""
+    try:
+        frontmatter, sections = tokenize_md(text, raw_section=2)
+        if frontmatter is None:
+            raise ValueError("Invalid todo file format: missing properties section.")
+        try:
+            properties = normalize_links(parse_frontmatter(frontmatter))
+            if Config.STRICT or not plain_properties(properties):
+                from ted.data_types import build_properties
+
+                properties = build_properties(properties).model_dump()
+        except Exception as e:
+            print(f"Error parsing properties in todo file {filepath}: {e}")
+            return None
+        if not sections:
+            raise ValueError("Invalid todo file format: missing name section.")
+
+        tasks = [
+            TaskSummary(*parse_task_line(line))
+            for line in section_lines(sections, 1)
+            if line.startswith("- [")
+        ]
+        return TodoSummary(
+            properties["id"],
+            sections[0][0],
+            os.path.basename(filepath),
+            filepath,
+            properties.get("tags", []),
+            properties.get("blocked_by") or [],
+            tasks,
+        )
+    except Exception as e:
+        print(f"Error parsing todo file {filepath}: {e}")
+        return None
@@ -0,0 +1,220 @@
+import builtins
+import contextlib
+import heapq
+import json
+import sys
+import time
+
+# The PhaseProfiler in use, if any. Instrumented code checks this once per
+# call and does nothing else when it is None.
+ACTIVE: "PhaseProfiler | None" = None
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class ImportProfiler:
+    """Time imports made after start() by wrapping builtins.__import__."""
+
+    def __init__(self):
+        self.records: list[tuple[int, str, float]] = []
+        self.started_at = 0.0
+        self._depth = 0
+        self._original_import = builtins.__import__
+
+    def start(self):
+        original_import = self._original_import
+        self.started_at = time.perf_counter()
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original_import(name, globals, locals, fromlist, level)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                elapsed = time.perf_counter() - start
+                self.records.append((self._depth, name, elapsed))
+
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        builtins.__import__ = self._original_import
+
+    def report(self, cli_import_time: float, top: int = 15, file=None):
+        file = file or sys.stderr
+        total = time.perf_counter() - self.started_at
+        imported = sorted(
+            ((elapsed, name) for depth, name, elapsed in self.records if depth == 0),
+            reverse=True,
+        )
+        import_total = sum(elapsed for elapsed, _ in imported)
+        print("Startup profile:", file=file)
+        print(f"  {cli_import_time * 1000:8.1f} ms  import ted.cli", file=file)
+        for elapsed, name in imported[:top]:
+            print(f"  {elapsed * 1000:8.1f} ms  import {name}", file=file)
+        if len(imported) > top:
+            rest = sum(elapsed for elapsed, _ in imported[top:])
+            print(
+                f"  {rest * 1000:8.1f} ms  {len(imported) - top} more imports",
+                file=file,
+            )
+        print(
+            f"  {(total - import_total) * 1000:8.1f} ms  command (excluding imports)",
+            file=file,
+        )
+        print(
+            f"  {(cli_import_time + total) * 1000:8.1f} ms"
+            "  total since importing ted.cli",
+            file=file,
+        )
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "PhaseProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack.append(self.name)
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        key = "/".join(profiler._stack)
+        profiler._stack.pop()
+        record = profiler.phases.get(key)
+        if record is None:
+            profiler.phases[key] = [1, elapsed]
+        else:
+            record[0] += 1
+            record[1] += elapsed
+
+
+class PhaseProfiler:
+    """Per-phase timings and counters for one command.
+
+    Phases nest: a phase entered inside another is recorded as
+    "outer/inner". Peak memory comes from tracemalloc once trace_memory() is
+    called. Tracing slows allocation-heavy phases down, so compare phases
+    with each other rather than with an unprofiled run.
+    """
+
+    def __init__(self, slowest: int = 10):
+        self.slowest = slowest
+        self.phases: dict[str, list] = {}
+        self.counters: dict[str, int] = {}
+        self.files: list[tuple[float, str]] = []
+        self.started_at = 0.0
+        self.total = 0.0
+        self.peak_memory = 0
+        self._stack: list[str] = []
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def trace_memory(self):
+        import tracemalloc
+
+        tracemalloc.start()
+
+    def stop(self):
+        import tracemalloc
+
+        self.total = time.perf_counter() - self.started_at
+        if tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_file(self, path: str, seconds: float):
+        if len(self.files) < self.slowest:
+            heapq.heappush(self.files, (seconds, path))
+        elif seconds > self.files[0][0]:
+            heapq.heapreplace(self.files, (seconds, path))
+
+    def summary(self) -> dict:
+        try:
+            import resource
+
+            max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            max_rss_kb = None
+        top_level = sum(
+            seconds for key, (_, seconds) in self.phases.items() if "/" not in key
+        )
+        return {
+            "command": sys.argv[1:],
+            "total_ms": self.total * 1000,
+            "unaccounted_ms": (self.total - top_level) * 1000,
+            "phases": [
+                {"phase": key, "calls": calls, "ms": seconds * 1000}
+                for key, (calls, seconds) in self.phases.items()
+            ],
+            "counters": self.counters,
+            "slowest_files": [
+                {"path": path, "ms": seconds * 1000}
+                for seconds, path in sorted(self.files, reverse=True)
+            ],
+            "peak_memory_bytes": self.peak_memory,
+            "max_rss_kb": max_rss_kb,
+        }
+
+    def report(self, fmt: str = "text", file=None):
+        file = file or sys.stderr
+        summary = self.summary()
+        if fmt == "json":
+            print(json.dumps(summary, indent=2), file=file)
+            return
+        print(f"Profile: {summary['total_ms']:.1f} ms total", file=file)
+        print(f"  {'phase':<32} {'calls':>7} {'ms':>10}", file=file)
+        # Parents are recorded after their children finish, so sort by path.
+        for entry in sorted(summary["phases"], key=lambda entry: entry["phase"]):
+            depth = entry["phase"].count("/")
+            name = "  " * depth + entry["phase"].rsplit("/", 1)[-1]
+            print(f"  {name:<32} {entry['calls']:>7} {entry['ms']:>10.1f}", file=file)
+        unaccounted = summary["unaccounted_ms"]
+        print(f"  {'(output and other work)':<40} {unaccounted:>10.1f}", file=file)
+        if summary["counters"]:
+            print("Counters:", file=file)
+            for name, value in summary["counters"].items():
+                print(f"  {name:<32} {value:>18}", file=file)
+        if summary["slowest_files"]:
+            print("Slowest files to parse:", file=file)
+            for entry in summary["slowest_files"]:
+                print(f"  {entry['ms']:8.2f} ms  {entry['path']}", file=file)
+        peak_mib = summary["peak_memory_bytes"] / 2**20
+        print(f"Peak memory (tracemalloc): {peak_mib:.1f} MiB", file=file)
+
+
+def enable(slowest: int = 10) -> PhaseProfiler:
+    global ACTIVE
+    ACTIVE = PhaseProfiler(slowest)
+    ACTIVE.start()
+    return ACTIVE
+
+
+def disable() -> PhaseProfiler | None:
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def phase(name: str):
+    """Time a block as a phase of the active profiler, if there is one."""
+    return _NULL_PHASE if ACTIVE is None else ACTIVE.phase(name)
+
+
+def count(name: str, n: int = 1):
+    if ACTIVE is not None:
+        ACTIVE.count(name, n)
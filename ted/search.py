@@ -0,0 +1,286 @@
+import bisect
+import math
+import os
+import pickle
+import re
+from collections import Counter
+
+from ted.cache import is_racy, stat_key
+
+INDEX_VERSION = 3
+NAME_BOOST = 3
+# Prefix matches of the last query word score at most this much of a
+# whole-word match with the same document frequency.
+PREFIX_PENALTY = 0.5
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def document_fields(item) -> tuple[str, str]:
+    """Return (name, body) text to index for a todo, project or reference."""
+    kind = type(item).__name__
+    if kind == "TodoData":
+        body = [item.goal, item.note, item.properties.info]
+        body += [task.description for task in item.tasks]
+        body += item.info
+        return item.name, "\n".join(body)
+    if kind == "ProjectData":
+        return f"{item.shorthand} {item.name}", "\n".join(
+            [item.description] + item.info
+        )
+    if kind == "ReferenceData":
+        return item.name, "\n".join([item.tldr, item.ref.content, item.task])
+    return "", ""
+
+
+class SearchIndex:
+    """Persistent inverted index over names, goals, tasks, info, notes,
+    project descriptions and reference TLDRs.
+
+    sync() compares the index against a stat-only walk of the vault, so only
+    files whose stat_key changed are read and re-indexed. Scores are BM25
+    with name terms counted NAME_BOOST times.
+
+    Only what queries read is pickled. The terms of each document, needed
+    to remove it, are rebuilt from the postings the first time a file
+    changed.
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self.docs: dict[str, dict] = {}
+        self._doc_terms: dict[str, dict[str, int]] | None = {}
+        self.postings: dict[str, dict[str, int]] = {}
+        self.total_length = 0
+        self.dirty = False
+        self._terms: list[str] | None = None
+        self._norms: dict[str, float] | None = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file, "rb") as f:
+                payload = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if payload.get("version") != INDEX_VERSION:
+            return
+        self.docs = payload["docs"]
+        self.postings = payload["postings"]
+        self._doc_terms = None
+        self.total_length = payload["total_length"]
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "docs": self.docs,
+                    "postings": self.postings,
+                    "total_length": self.total_length,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_file, self.index_file)
+        self.dirty = False
+
+    @property
+    def doc_terms(self) -> dict[str, dict[str, int]]:
+        """{path: {term: count}}, the postings inverted."""
+        if self._doc_terms is None:
+            doc_terms: dict[str, dict[str, int]] = {}
+            for term, posting in self.postings.items():
+                for path, count in posting.items():
+                    terms = doc_terms.get(path)
+                    if terms is None:
+                        terms = doc_terms[path] = {}
+                    terms[term] = count
+            self._doc_terms = doc_terms
+        return self._doc_terms
+
+    def remove(self, path: str):
+        if path not in self.docs:
+            return
+        # A document without any terms has no entry in doc_terms.
+        for term in self.doc_terms.pop(path, {}):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(path, None)
+            if not posting:
+                del self.postings[term]
+                self._terms = None
+        self.total_length -= self.docs.pop(path)["length"]
+        self._norms = None
+        self.dirty = True
+
+    def add(self, path: str, key: tuple | None, item, done: bool):
+        """Index item parsed from path; a key of None re-indexes it next sync."""
+        self.remove(path)
+        name, body = document_fields(item)
+        terms = Counter(tokenize(body))
+        for term in tokenize(name):
+            terms[term] += NAME_BOOST
+        for term, count in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                self._terms = None
+            posting[path] = count
+        length = sum(terms.values())
+        self.doc_terms[path] = terms
+        self.docs[path] = {
+            "key": key,
+            "kind": "done" if done else type(item).__name__,
+            "id": item.id,
+            "name": name.strip(),
+            "project_id": getattr(item.properties, "project_id", None) or "",
+            "length": length,
+        }
+        self.total_length += length
+        self._norms = None
+        self.dirty = True
+
+    def sync(
+        self,
+        files: dict[str, list[tuple[str, os.stat_result]]],
+        parse,
+        checked_ns: int,
+    ) -> int:
+        """Bring the index up to date with {kind: [(path, stat), ...]}.
+
+        parse gets [(path, kind), ...] of the new and changed files and
+        returns their parsed items in order. checked_ns is a time taken
+        before the files were stat'ed; racy files are parsed again next time.
+        Returns the number of files parsed.
+        """
+        current = {
+            path: (kind, st) for kind, listing in files.items() for path, st in listing
+        }
+        for path in [path for path in self.docs if path not in current]:
+            self.remove(path)
+        changed = []
+        for path, (kind, st) in current.items():
+            doc = self.docs.get(path)
+            if doc is None or doc["key"] != stat_key(st):
+                changed.append((path, kind, st))
+        if not changed:
+            return 0
+        items = parse([(path, kind) for path, kind, _ in changed])
+        for (path, kind, st), item in zip(changed, items):
+            if item is None:
+                self.remove(path)
+                continue
+            key = None if is_racy(st, checked_ns) else stat_key(st)
+            self.add(path, key, item, kind == "done")
+        return len(changed)
+
+    def expand(self, token: str) -> list[str]:
+        """Indexed terms starting with token, token itself included."""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect.bisect_left(self._terms, token)
+        matches = []
+        for term in self._terms[start:]:
+            if not term.startswith(token):
+                break
+            matches.append(term)
+        return matches
+
+    def norms(self) -> dict[str, float]:
+        """BM25 length normalization of every document, kept until one
+        is added or removed."""
+        if self._norms is None:
+            avg_length = self.total_length / len(self.docs)
+            self._norms = {
+                path: BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avg_length)
+                for path, doc in self.docs.items()
+            }
+        return self._norms
+
+    @staticmethod
+    def _idf(n_docs: int, doc_freq: int) -> float:
+        return math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def _weighted_terms(
+        self, token: str, prefix: bool, n_docs: int
+    ) -> list[tuple[str, float]]:
+        """(term, weight * idf) of the terms token matches.
+
+        Prefix expansions share the IDF of every document token matches,
+        token itself included, so a rare completion cannot outscore the word
+        that was typed, and are weighted down by PREFIX_PENALTY.
+        """
+        weighted = []
+        if token in self.postings:
+            weighted.append((token, self._idf(n_docs, len(self.postings[token]))))
+        if not prefix:
+            return weighted
+        matches = self.expand(token)
+        expansions = [term for term in matches if term != token]
+        if not expansions:
+            return weighted
+        docs = set()
+        for term in matches:
+            docs.update(self.postings[term])
+        idf = PREFIX_PENALTY * self._idf(n_docs, len(docs))
+        weighted.extend((term, idf) for term in expansions)
+        return weighted
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        done: bool = False,
+        project: str | None = None,
+    ) -> list[tuple[float, dict]]:
+        tokens = tokenize(query)
+        if not tokens or not self.docs:
+            return []
+        n_docs = len(self.docs)
+        norms = self.norms()
+        project = project.lower() if project else None
+
+        scores: dict[str, float] | None = None
+        for i, token in enumerate(tokens):
+            token_scores: dict[str, float] = {}
+            # Only the last word may still be being typed.
+            prefix = i == len(tokens) - 1
+            for term, idf in self._weighted_terms(token, prefix, n_docs):
+                weight = idf * (BM25_K1 + 1)
+                for path, tf in self.postings[term].items():
+                    score = weight * tf / (tf + norms[path])
+                    if score > token_scores.get(path, 0.0):
+                        token_scores[path] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    path: score + token_scores[path]
+                    for path, score in scores.items()
+                    if path in token_scores
+                }
+            if not scores:
+                return []
+
+        results = []
+        for path, score in (scores or {}).items():
+            doc = self.docs[path]
+            if doc["kind"] == "done" and not done:
+                continue
+            if project and project not in doc["project_id"].lower():
+                continue
+            results.append((score, doc))
+        results.sort(key=lambda result: (-result[0], result[1]["id"]))
+        return results[:limit]
@@ -0,0 +1,204 @@
+import mmap
+import os
+import pickle
+import struct
+from array import array
+
+MAGIC = b"TEDSNAP\x00"
+SNAPSHOT_VERSION = 4
+KINDS = ("TodoData", "ProjectData", "ReferenceData")
+
+_HEADER = struct.Struct("<8sII")  # magic, version, files
+_SECTION = struct.Struct("<16sQQ")  # name, offset, length
+_STRING_COLUMNS = ("path", "id", "name", "created")
+_SECTIONS = (
+    ("mtime", "q"),
+    ("size", "q"),
+    ("ino", "Q"),
+    ("ctime", "q"),
+    ("kind", "B"),
+    ("payload_off", "Q"),
+    *((f"{column}_off", "I") for column in _STRING_COLUMNS),
+    *((column, None) for column in _STRING_COLUMNS),
+    ("payload", None),
+)
+
+
+class SnapshotRecord:
+    """Manifest entry and string columns for one parsed file.
+
+    It is written next to the file's pickled item; rows carried over from an
+    older snapshot pass their payload bytes through without unpickling them.
+    """
+
+    __slots__ = ("path", "key", "kind", "id", "name", "created")
+
+    def __init__(self, path, key, kind, id, name, created):
+        self.path = path
+        # (mtime_ns, size, ino, ctime_ns), see ted.cache.stat_key.
+        self.key = key
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.created = created
+
+    @classmethod
+    def from_item(cls, path: str, key: tuple, item):
+        return cls(
+            path,
+            key,
+            type(item).__name__,
+            str(item.id),
+            item.name,
+            item.properties.created,
+        )
+
+
+def _string_column(values: list[str]) -> tuple[array, bytes]:
+    offsets = array("I", [0])
+    chunks = []
+    end = 0
+    for value in values:
+        data = value.encode()
+        chunks.append(data)
+        end += len(data)
+        offsets.append(end)
+    return offsets, b"".join(chunks)
+
+
+def write_snapshot(snapshot_file: str, records: list[tuple[SnapshotRecord, bytes]]):
+    """Write records to snapshot_file atomically."""
+    columns: dict[str, object] = {
+        "mtime": array("q", (record.key[0] for record, _ in records)),
+        "size": array("q", (record.key[1] for record, _ in records)),
+        "ino": array("Q", (record.key[2] for record, _ in records)),
+        "ctime": array("q", (record.key[3] for record, _ in records)),
+        "kind": array("B", (KINDS.index(record.kind) for record, _ in records)),
+    }
+    payload_off = array("Q", [0])
+    end = 0
+    for _, payload in records:
+        end += len(payload)
+        payload_off.append(end)
+    columns["payload_off"] = payload_off
+    for column in _STRING_COLUMNS:
+        offsets, data = _string_column(
+            [getattr(record, column) for record, _ in records]
+        )
+        columns[f"{column}_off"] = offsets
+        columns[column] = data
+
+    table_size = _HEADER.size + 4 + _SECTION.size * len(_SECTIONS)
+    offset = table_size
+    layout = []
+    for name, _ in _SECTIONS:
+        if name == "payload":
+            length = end
+        else:
+            data = columns[name]
+            is_array = isinstance(data, array)
+            length = len(data) * data.itemsize if is_array else len(data)
+        offset += -offset % 8
+        layout.append((name, offset, length))
+        offset += length
+
+    os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+    tmp_file = snapshot_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(records)))
+        f.write(struct.pack("<I", len(layout)))
+        for name, section_offset, length in layout:
+            f.write(_SECTION.pack(name.encode(), section_offset, length))
+        for name, section_offset, _ in layout:
+            f.write(b"\0" * (section_offset - f.tell()))
+            if name == "payload":
+                for _, payload in records:
+                    f.write(payload)
+            else:
+                data = columns[name]
+                f.write(data.tobytes() if isinstance(data, array) else data)
+    os.replace(tmp_file, snapshot_file)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Opening it maps the file and reads the fixed-size columns; pickled
+    items are only unpickled when item() is called for their row.
+    """
+
+    def __init__(self, snapshot_file: str):
+        self.snapshot_file = snapshot_file
+        with open(snapshot_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if len(view) < _HEADER.size + 4:
+            raise ValueError("Snapshot is truncated")
+        magic, version, self.n_files = _HEADER.unpack_from(view)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Not a snapshot of this version")
+        (count,) = struct.unpack_from("<I", view, _HEADER.size)
+        self._sections: dict[str, memoryview] = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(
+                view, _HEADER.size + 4 + i * _SECTION.size
+            )
+            if offset + length > len(view):
+                raise ValueError("Snapshot is truncated")
+            name = name.rstrip(b"\0").decode()
+            self._sections[name] = view[offset : offset + length]
+        for name, typecode in _SECTIONS:
+            if typecode is not None:
+                self._sections[name] = self._sections[name].cast(typecode)
+
+        self.mtimes = self._sections["mtime"]
+        self.sizes = self._sections["size"]
+        self.inos = self._sections["ino"]
+        self.ctimes = self._sections["ctime"]
+        self.kinds = self._sections["kind"]
+        self.rows = {path: row for row, path in enumerate(self.column("path"))}
+
+    def column(self, name: str) -> list[str]:
+        """Decode a whole string column: path, id, name or created."""
+        offsets = self._sections[f"{name}_off"]
+        data = bytes(self._sections[name])
+        return [
+            data[offsets[i] : offsets[i + 1]].decode() for i in range(len(offsets) - 1)
+        ]
+
+    def key(self, row: int) -> tuple[int, int, int, int]:
+        return (self.mtimes[row], self.sizes[row], self.inos[row], self.ctimes[row])
+
+    def kind(self, row: int) -> str:
+        return KINDS[self.kinds[row]]
+
+    def payload(self, row: int) -> memoryview:
+        offsets = self._sections["payload_off"]
+        return self._sections["payload"][offsets[row] : offsets[row + 1]]
+
+    def item(self, row: int):
+        return pickle.loads(self.payload(row))
+
+    def record(self, row: int, path: str) -> SnapshotRecord:
+        def string(column: str) -> str:
+            offsets = self._sections[f"{column}_off"]
+            data = self._sections[column][offsets[row] : offsets[row + 1]]
+            return bytes(data).decode()
+
+        return SnapshotRecord(
+            path,
+            self.key(row),
+            self.kind(row),
+            string("id"),
+            string("name"),
+            string("created"),
+        )
+
+    def close(self):
+        self._sections = {}
+        self.mtimes = self.sizes = self.inos = self.ctimes = self.kinds = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A payload view is still alive; the map goes away with it.
+            pass
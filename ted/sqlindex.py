@@ -0,0 +1,350 @@
+import os
+import sqlite3
+import time
+
+from ted import profiling
+from ted.cache import is_racy, stat_key
+from ted.data_types import PARSERS, TodoQueries, id_to_int
+from ted.mdparse import TaskSummary, TodoSummary, read_md_file
+
+SCHEMA_VERSION = 2
+# The stat columns of files hold ted.cache.stat_key, or NULL when the file
+# changed too recently for it to be trusted (see ted.cache.is_racy).
+_SCHEMA = """
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    ino INTEGER,
+    ctime_ns INTEGER
+);
+CREATE TABLE todos (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    id TEXT NOT NULL,
+    id_int INTEGER,
+    name TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    project_id TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE tasks (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    done INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (path, position)
+);
+CREATE TABLE tags (tag TEXT NOT NULL, path TEXT NOT NULL);
+CREATE TABLE blocked_by (path TEXT NOT NULL, blocker TEXT NOT NULL);
+CREATE TABLE projects (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    id TEXT NOT NULL,
+    id_int INTEGER,
+    name TEXT NOT NULL,
+    shorthand TEXT NOT NULL
+);
+CREATE TABLE refs (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    id TEXT NOT NULL,
+    id_int INTEGER,
+    name TEXT NOT NULL,
+    task TEXT NOT NULL
+);
+CREATE INDEX todos_id ON todos (id);
+CREATE INDEX todos_filename ON todos (filename);
+CREATE INDEX todos_id_int ON todos (id_int);
+CREATE INDEX tags_tag ON tags (tag);
+CREATE INDEX tags_path ON tags (path);
+CREATE INDEX blocked_by_path ON blocked_by (path);
+CREATE INDEX projects_id ON projects (id);
+CREATE INDEX projects_id_int ON projects (id_int);
+CREATE INDEX refs_id ON refs (id);
+CREATE INDEX refs_id_int ON refs (id_int);
+"""
+_TABLES = ("files", "todos", "tasks", "tags", "blocked_by", "projects", "refs")
+_TABLE_FOR_TYPE = {"todos": "todos", "projects": "projects", "references": "refs"}
+_SUMMARY_COLUMNS = """
+    id, name, filename, path,
+    (SELECT group_concat(tag, char(10)) FROM tags WHERE tags.path = todos.path),
+    (SELECT group_concat(blocker, char(10)) FROM blocked_by
+     WHERE blocked_by.path = todos.path)
+"""
+
+
+def _id_int(item_id: str) -> int | None:
+    try:
+        return id_to_int(item_id)
+    except ValueError:
+        return None
+
+
+def _summary(row, tasks: list[TaskSummary]) -> TodoSummary:
+    _id, name, filename, path, tags, blocked_by = row
+    return TodoSummary(
+        _id,
+        name,
+        filename,
+        path,
+        tags.split("\n") if tags else [],
+        blocked_by.split("\n") if blocked_by else [],
+        tasks,
+    )
+
+
+class SqlIndex(TodoQueries):
+    """SQLite mirror of the vault for indexed lookups.
+
+    The markdown files stay the source of truth: sync() compares every file's
+    stat_key with the files table and reparses only what changed, and
+    the whole database can be deleted and rebuilt at any time. dirs maps the
+    vault directory keys in PARSERS to their paths.
+
+    Listing queries (TodoQueries) run over the open todos, which are read
+    from the database once and kept until the index changes.
+    """
+
+    def __init__(self, db_file: str, dirs: dict[str, str]):
+        self.db_file = db_file
+        self.dirs = dirs
+        self._todos: list[TodoSummary] | None = None
+        self._by_tag: dict[str, set[str]] | None = None
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.db = sqlite3.connect(db_file, timeout=10)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self._create()
+
+    def _changed(self):
+        self._todos = None
+        self._by_tag = None
+
+    def _create(self):
+        self._changed()
+        with self.db:
+            for table in _TABLES:
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.executescript(_SCHEMA)
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.db.close()
+
+    def kind_of(self, path: str) -> str | None:
+        """The vault directory key whose tree contains path."""
+        for kind, directory in self.dirs.items():
+            if path.startswith(os.path.join(directory, "")):
+                return kind
+        return None
+
+    def parse(self, path: str, kind: str | None = None):
+        """Parse an indexed file with the parser for its directory."""
+        return PARSERS[kind or self.kind_of(path)](read_md_file(path), path)
+
+    def sync(
+        self, files: dict[str, list[tuple[str, os.stat_result]]], checked_ns: int
+    ) -> tuple[int, int]:
+        """Bring the index up to date with {kind: [(path, stat), ...]} from
+        Vault.get_files.
+
+        checked_ns is a time taken before the files were stat'ed; racy
+        files are reparsed again next time. Returns how many files were
+        reparsed and how many were dropped.
+        """
+        known = {
+            path: (kind, *key)
+            for path, kind, *key in self.db.execute(
+                "SELECT path, kind, mtime_ns, size, ino, ctime_ns FROM files"
+            )
+        }
+        seen = set()
+        changed = []
+        for kind, entries in files.items():
+            for path, st in entries:
+                seen.add(path)
+                if known.get(path) != (kind, *stat_key(st)):
+                    changed.append((kind, path, st))
+        removed = [path for path in known if path not in seen]
+        if changed or removed:
+            with self.db:
+                for path in removed:
+                    self._delete(path)
+                for kind, path, st in changed:
+                    self._delete(path)
+                    self._insert(kind, path, st, checked_ns)
+        profiling.count("index_reparsed", len(changed))
+        return len(changed), len(removed)
+
+    def rebuild(
+        self, files: dict[str, list[tuple[str, os.stat_result]]], checked_ns: int
+    ) -> tuple[int, int]:
+        self._create()
+        return self.sync(files, checked_ns)
+
+    def update_paths(self, written: list[str], removed: list[str]):
+        """Commit hook for ted.atomic: reindex files right after a write."""
+        try:
+            with self.db:
+                for path in [*written, *removed]:
+                    kind = self.kind_of(path)
+                    if kind is None:
+                        continue
+                    self._delete(path)
+                    checked_ns = time.time_ns()
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    self._insert(kind, path, st, checked_ns)
+        except sqlite3.Error:
+            # The files are written; the next sync() sees their new mtimes.
+            pass
+
+    def _delete(self, path: str):
+        self._changed()
+        for table in _TABLES:
+            self.db.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+    def _insert(self, kind: str, path: str, st: os.stat_result, checked_ns: int):
+        key = (None,) * 4 if is_racy(st, checked_ns) else stat_key(st)
+        self.db.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", (path, kind, *key)
+        )
+        try:
+            item = self.parse(path, kind)
+        except (OSError, ValueError) as e:
+            print(f"Error indexing {path}: {e}")
+            return
+        if item is None:
+            return
+        item_id = str(item.id)
+        if kind in ("todos", "done"):
+            properties = item.properties
+            self.db.execute(
+                "INSERT INTO todos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    item.filename,
+                    item_id,
+                    _id_int(item_id),
+                    item.name,
+                    kind == "done",
+                    item.is_completed(),
+                    properties.project_id,
+                    properties.created,
+                ),
+            )
+            self.db.executemany(
+                "INSERT INTO tasks VALUES (?, ?, ?, ?)",
+                [
+                    (path, position, task.done, task.description)
+                    for position, task in enumerate(item.tasks)
+                ],
+            )
+            self.db.executemany(
+                "INSERT INTO tags VALUES (?, ?)",
+                [(tag, path) for tag in properties.tags],
+            )
+            self.db.executemany(
+                "INSERT INTO blocked_by VALUES (?, ?)",
+                [(path, blocker) for blocker in properties.blocked_by or []],
+            )
+        elif kind == "projects":
+            self.db.execute(
+                "INSERT INTO projects VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    item.filename,
+                    item_id,
+                    _id_int(item_id),
+                    item.name,
+                    item.shorthand,
+                ),
+            )
+        else:
+            self.db.execute(
+                "INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    item.filename,
+                    item_id,
+                    _id_int(item_id),
+                    item.name,
+                    item.task,
+                ),
+            )
+
+    def find(
+        self, data_type: str, item_id: str, include_done: bool = False
+    ) -> str | None:
+        """Path of the item matching item_id by id, filename or numeric id.
+
+        Like VaultData.find: for "todos", open todos are searched first and
+        done ones only if include_done is set.
+        """
+        if data_type not in _TABLE_FOR_TYPE:
+            raise ValueError(f"Unknown data type: {data_type}")
+        table = _TABLE_FOR_TYPE[data_type]
+        conditions = [""]
+        if table == "todos":
+            conditions = ["AND NOT done", "AND done"][: 2 if include_done else 1]
+        for condition in conditions:
+            for column in ("id", "filename", "id_int"):
+                value = id_to_int(item_id) if column == "id_int" else item_id
+                row = self.db.execute(
+                    f"SELECT path FROM {table} WHERE {column} = ? {condition}"
+                    " ORDER BY path LIMIT 1",
+                    (value,),
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+        return None
+
+    def get_next_id(self, data_type: str) -> int:
+        if data_type not in _TABLE_FOR_TYPE:
+            raise ValueError(f"Unknown data type: {data_type}")
+        table = _TABLE_FOR_TYPE[data_type]
+        (max_id,) = self.db.execute(f"SELECT max(id_int) FROM {table}").fetchone()
+        return (max_id or 0) + 1
+
+    @property
+    def todos(self) -> list[TodoSummary]:
+        """Every open todo, ordered by path, like VaultData.todos."""
+        if self._todos is None:
+            self._todos = self._summaries()
+        return self._todos
+
+    def _tag_index(self) -> dict[str, set[str]]:
+        if self._by_tag is None:
+            self._by_tag = super()._tag_index()
+        return self._by_tag
+
+    def _todo_dir(self) -> str:
+        return self.dirs["todos"]
+
+    def _summaries(self) -> list[TodoSummary]:
+        tasks: dict[str, list[TaskSummary]] = {}
+        for path, done, description in self.db.execute(
+            "SELECT path, done, description FROM tasks"
+            " WHERE path IN (SELECT path FROM todos WHERE NOT done)"
+            " ORDER BY path, position"
+        ):
+            tasks.setdefault(path, []).append(TaskSummary(bool(done), description))
+        rows = self.db.execute(
+            f"SELECT {_SUMMARY_COLUMNS} FROM todos WHERE NOT done ORDER BY path"
+        )
+        return [_summary(row, tasks.get(row[3], [])) for row in rows]
+
+    def stats(self) -> dict:
+        counts = {
+            table: self.db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+            for table in _TABLES
+        }
+        size = os.path.getsize(self.db_file) if os.path.exists(self.db_file) else 0
+        return {"file": self.db_file, "size": size, "rows": counts}
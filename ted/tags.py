@@ -0,0 +1,79 @@
+import re
+
+_TOKEN_RE = re.compile(r"\(|\)|[^\s()]+")
+_KEYWORDS = {"and", "or", "not"}
+
+
+def _tokens(query: str) -> list[str]:
+    return _TOKEN_RE.findall(query)
+
+
+def parse_tag_query(query: str):
+    """Parse e.g. 'work and not (waiting or someday)' into a nested tuple.
+
+    Nodes are ("tag", name), ("not", node), ("and", a, b) and ("or", a, b).
+    "not" binds tighter than "and", which binds tighter than "or". A leading
+    "#" on a tag is ignored. Raises ValueError on malformed queries.
+    """
+    tokens = _tokens(query)
+    pos = 0
+
+    def peek() -> str | None:
+        return tokens[pos].lower() if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        node = parse_and()
+        while peek() == "or":
+            pos += 1
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        nonlocal pos
+        node = parse_not()
+        while peek() == "and":
+            pos += 1
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        nonlocal pos
+        if peek() == "not":
+            pos += 1
+            return ("not", parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        nonlocal pos
+        token = peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of tag query: {query!r}")
+        if token == "(":
+            pos += 1
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"Missing ')' in tag query: {query!r}")
+            pos += 1
+            return node
+        if token == ")" or token in _KEYWORDS:
+            raise ValueError(f"Unexpected {tokens[pos]!r} in tag query: {query!r}")
+        pos += 1
+        return ("tag", tokens[pos - 1].lstrip("#"))
+
+    node = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos]!r} in tag query: {query!r}")
+    return node
+
+
+def evaluate_tag_query(node, postings: dict[str, set[str]], universe: set[str]):
+    """Evaluate a parsed query with set operations on tag postings."""
+    op = node[0]
+    if op == "tag":
+        return postings.get(node[1], set())
+    if op == "not":
+        return universe - evaluate_tag_query(node[1], postings, universe)
+    left = evaluate_tag_query(node[1], postings, universe)
+    right = evaluate_tag_query(node[2], postings, universe)
+    return left & right if op == "and" else left | right
@@ -1,18 +1,49 @@
+import os
+import threading
+import time
 from datetime import datetime
+from typing import TYPE_CHECKING
 
 import click
 
-from ted.data_types import (
-    TodoData,
-    ProjectData,
-)
+if TYPE_CHECKING:
+    from ted.blobs import BlobStore
+    from ted.data_types import (
+        TodoData,
+        ProjectData,
+    )
 
 
 def new_timestamp():
     return datetime.now().strftime("%m-%d-%Y_%H_%M_%S")
 
 
-def prompt_project_selection(projects: list[ProjectData]):
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ULID_LOCK = threading.Lock()
+_last_ulid = (0, 0)
+
+
+def new_ulid() -> str:
+    """26-character ULID: 48-bit millisecond time, then 80 random bits.
+
+    Ids sort by creation time. Within one millisecond the random part is
+    incremented, so ids from one process are strictly increasing; ids from
+    different processes only collide if 80 random bits do.
+    """
+    global _last_ulid
+    with _ULID_LOCK:
+        ms = time.time_ns() // 1_000_000
+        last_ms, last_rand = _last_ulid
+        if ms <= last_ms and last_rand + 1 < 1 << 80:
+            ms, rand = last_ms, last_rand + 1
+        else:
+            ms, rand = max(ms, last_ms + 1), int.from_bytes(os.urandom(10), "big")
+        _last_ulid = (ms, rand)
+    value = ms << 80 | rand
+    return "".join(_CROCKFORD[value >> shift & 31] for shift in range(125, -1, -5))
+
+
+def prompt_project_selection(projects: "list[ProjectData]"):
     if not projects:
         return None
     click.echo("Available project files: ")
@@ -33,7 +64,7 @@ def prompt_project_selection(projects: list[ProjectData]):
     return projects[int(project_idx) - 1]
 
 
-def prompt_todo_selection(todos: list[TodoData]) -> TodoData | None:
+def prompt_todo_selection(todos: "list[TodoData]") -> "TodoData | None":
     if not todos:
         return None
     click.echo("Available todo files: ")
@@ -64,3 +95,14 @@ def crop_filename(filename: str, max_length: int = 20) -> str:
                 return "_".join(split_filename[:-i])
 
         return filename[:max_length]  # Fallback: return last max_length characters
+
+
+def download_file(
+    session, url: str, dest_path: str, store: "BlobStore", chunk_size: int = 1 << 16
+) -> int:
+    """Stream url into the blob store and link it at dest_path; returns bytes."""
+    with session.get(url, stream=True) as response:
+        response.raise_for_status()
+        digest, size = store.put_stream(response.iter_content(chunk_size=chunk_size))
+    store.link(digest, dest_path)
+    return size
@@ -1,11 +1,39 @@
 from ted.config import Config
 import os
+import time
+from collections import deque
+from ted import profiling
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ted.cache import ListingCache, ParseCache, listing_key
+from ted.search import SearchIndex
 from ted.data_types import (
+    PARSERS,
+    TodoListing,
     VaultData,
     from_md_file,
-    ref_from_md_file,
-    proj_from_md_file,
+    todo_from_md,
+    ref_from_md,
+    proj_from_md,
 )
+from ted.mdparse import TodoSummary, read_md_file, read_md_header, summary_from_md
+
+# Below this many uncached files a pool costs more to start than it saves.
+PARALLEL_MIN_FILES = 64
+# load_vault_data arguments that load a single data type (open todos only).
+_ONLY = {
+    "todos": dict(dones=False, projects=False, references=False),
+    "projects": dict(todos=False, dones=False, references=False),
+    "references": dict(todos=False, dones=False, projects=False),
+}
+# Directories the SQLite index mirrors and the parse cache is sharded by.
+INDEX_DIRS = ("todos", "done", "projects", "ref")
+
+
+def _parse_text(parser, text: str, filepath: str, strict: bool):
+    # Worker processes started with spawn or forkserver import a fresh
+    # Config, so the parent's --strict has to be passed along.
+    Config.STRICT = strict
+    return parser(text, filepath)
 
 
 class Vault:
@@ -22,57 +50,348 @@ class Vault:
             "ref": config.REF_DIR,
             "files": config.FILES_DIR,
         }
+        self.parse_cache_file = config.PARSE_CACHE_FILE
+        self.snapshot_file = config.SNAPSHOT_FILE
+        self._cache: ParseCache | None = None
+        self.listing_cache_file = config.LISTING_CACHE_FILE
+        self._listings: ListingCache | None = None
+        self.workers = config.LOAD_WORKERS
+        self.search_index_file = config.SEARCH_INDEX_FILE
+        self._search_index: SearchIndex | None = None
+        self.index_db_file = config.INDEX_DB_FILE
+        self._index = None
+        self._index_synced = False
+
+    @property
+    def cache(self) -> ParseCache:
+        # Loaded on first use: commands answered from the SQLite index
+        # never need the parse cache.
+        if self._cache is None:
+            with profiling.phase("cache_load"):
+                self._cache = ParseCache(
+                    self.parse_cache_file,
+                    self.snapshot_file,
+                    {key: self.required_dirs[key] for key in INDEX_DIRS},
+                )
+        return self._cache
+
+    @property
+    def listings(self) -> ListingCache:
+        if self._listings is None:
+            self._listings = ListingCache(self.listing_cache_file)
+        return self._listings
 
     def get_files(self, root_dir: str, file_extension: str = ".md"):
-        files: list[tuple[str, str, str]] = []
+        """(rel_path, name, full_path, stat) of every file under root_dir.
 
-        for root, dirs, fs in os.walk(root_dir):
-            for file in fs:
-                if not file.endswith(file_extension):
+        Directories are walked with os.scandir, and one whose stat has not
+        changed since the last walk is not listed again (see ListingCache).
+        Files are stat'ed here so callers need not stat them again. Callers
+        save self.listings once they are done walking.
+        """
+        files: list[tuple[str, str, str, os.stat_result]] = []
+        visited = set()
+        pending = deque([root_dir])
+        while pending:
+            directory = pending.popleft()
+            checked_ns = time.time_ns()
+            try:
+                dir_st = os.stat(directory)
+            except FileNotFoundError:
+                continue
+            visited.add(directory)
+            names = self.listings.get(directory, listing_key(dir_st))
+            entries = None
+            if names is None:
+                with os.scandir(directory) as scan:
+                    entries = {entry.name: entry for entry in scan}
+                names = sorted(
+                    name + "/" if entry.is_dir(follow_symlinks=False) else name
+                    for name, entry in entries.items()
+                )
+                self.listings.store(directory, dir_st, names, checked_ns)
+            rel_path = os.path.relpath(directory, root_dir)
+            for name in names:
+                if name.endswith("/"):
+                    pending.append(os.path.join(directory, name[:-1]))
                     continue
-                rel_path = os.path.relpath(root, root_dir)
-                files.append((rel_path, file, os.path.join(root, file)))
-
+                if not name.endswith(file_extension):
+                    continue
+                full_path = os.path.join(directory, name)
+                try:
+                    if entries is not None:
+                        st = entries[name].stat()
+                    else:
+                        st = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                files.append((rel_path, name, full_path, st))
+        self.listings.prune(visited, root_dir)
         return files
 
     def load_todos(self):
         todo_files = self.get_files(self.required_dirs["todos"])
         todos = []
-        for dirs, file, full_path in todo_files:
+        for dirs, file, full_path, _ in todo_files:
             todo = from_md_file(full_path)
             todos.append((dirs, todo))
+        self.listings.save()
         return todos
 
-    def load_vault_data(self) -> VaultData:
-        todo_files = self.get_files(self.required_dirs["todos"])
-        done_files = self.get_files(self.required_dirs["done"])
-        project_files = self.get_files(self.required_dirs["projects"])
-        reference_files = self.get_files(self.required_dirs["ref"])
+    def parse_files(self, jobs: list[tuple]) -> list:
+        """Parse (parser, filepath) jobs, returning results in job order."""
+        paths = [path for _, path in jobs]
+        parsers = [parser for parser, _ in jobs]
+        prof = profiling.ACTIVE
+        if self.workers <= 1 or len(jobs) < PARALLEL_MIN_FILES:
+            if prof is not None:
+                return self._parse_files_profiled(jobs, prof)
+            return [parser(read_md_file(path), path) for parser, path in jobs]
 
-        todos = []
-        for dirs, file, full_path in todo_files:
-            todo = from_md_file(full_path)
-            if todo:
-                todos.append(todo)
-        dones = []
-        for dirs, file, full_path in done_files:
-            done = from_md_file(full_path)
-            if done:
-                dones.append(done)
-
-        projects = []
-        for dirs, file, full_path in project_files:
-            project = proj_from_md_file(full_path)
-            projects.append(project)
-
-        references = []
-        for dirs, file, full_path in reference_files:
-            reference = ref_from_md_file(full_path)
-            references.append(reference)
-
-        return VaultData(
-            todos=todos, dones=dones, projects=projects, references=references
+        with profiling.phase("read"):
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                texts = list(pool.map(read_md_file, paths))
+        if prof is not None:
+            prof.count("files_read", len(texts))
+            prof.count("bytes_read", sum(len(text.encode()) for text in texts))
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        # Per-file times and YAML counts are not collected from worker processes.
+        with profiling.phase("parse_parallel"):
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                stricts = [Config.STRICT] * len(jobs)
+                return list(
+                    pool.map(
+                        _parse_text, parsers, texts, paths, stricts, chunksize=chunksize
+                    )
+                )
+
+    def _parse_files_profiled(self, jobs: list[tuple], prof) -> list:
+        results = []
+        for parser, path in jobs:
+            with prof.phase("read"):
+                text = read_md_file(path)
+            prof.count("files_read")
+            prof.count("bytes_read", len(text.encode()))
+            start = time.perf_counter()
+            with prof.phase("parse"):
+                results.append(parser(text, path))
+            prof.record_file(path, time.perf_counter() - start)
+        return results
+
+    def load_collections(
+        self, collections: dict[str, tuple], checked_ns: int | None = None
+    ) -> dict[str, list]:
+        """Load {name: (files, parser)} through the cache, keeping file order.
+
+        checked_ns is a time taken before the files were stat'ed.
+        """
+        slots: dict[str, list] = {}
+        missing = []
+        for name, (files, parser) in collections.items():
+            items = []
+            for dirs, file, full_path, st in files:
+                st, item = self.cache.lookup(full_path, st)
+                if Config.STRICT:
+                    # Cached items may have been built without validation.
+                    item = None
+                if item is None:
+                    missing.append((name, len(items), full_path, st, parser))
+                items.append(item)
+            slots[name] = items
+
+        if profiling.ACTIVE is not None:
+            total = sum(len(items) for items in slots.values())
+            profiling.count("cache_hits", total - len(missing))
+            profiling.count("cache_misses", len(missing))
+        parsed = self.parse_files(
+            [(parser, full_path) for _, _, full_path, _, parser in missing]
         )
+        for (name, index, full_path, st, _), item in zip(missing, parsed):
+            self.cache.store(full_path, st, item, checked_ns)
+            slots[name][index] = item
+
+        return {
+            name: [item for item in items if item] for name, items in slots.items()
+        }
+
+    def load_vault_data(
+        self,
+        todos: bool = True,
+        dones: bool = True,
+        projects: bool = True,
+        references: bool = True,
+    ) -> VaultData:
+        """Load the requested collections; skipped ones stay empty."""
+        wanted = {
+            "todos": (todos, "todos", todo_from_md),
+            "dones": (dones, "done", todo_from_md),
+            "projects": (projects, "projects", proj_from_md),
+            "references": (references, "ref", ref_from_md),
+        }
+        with profiling.phase("load"):
+            checked_ns = time.time_ns()
+            collections = {}
+            roots = []
+            for name, (load, dir_key, parser) in wanted.items():
+                if not load:
+                    continue
+                roots.append(self.required_dirs[dir_key])
+                with profiling.phase("walk"):
+                    files = self.get_files(self.required_dirs[dir_key])
+                profiling.count("files_walked", len(files))
+                collections[name] = (files, parser)
+
+            loaded = self.load_collections(collections, checked_ns)
+
+            with profiling.phase("cache_save"):
+                seen = {
+                    full_path
+                    for files, _ in collections.values()
+                    for _, _, full_path, _ in files
+                }
+                self.cache.prune(seen, roots)
+                self.cache.save()
+                self.listings.save()
+
+            with profiling.phase("build_index"):
+                return VaultData(**loaded)
+
+    def todo_summaries(self) -> list[TodoSummary]:
+        """Open todos from a header-only scan of the todos directory."""
+        with profiling.phase("header_scan"):
+            with profiling.phase("walk"):
+                files = self.get_files(self.required_dirs["todos"])
+                self.listings.save()
+            summaries = []
+            for _, _, full_path, _ in files:
+                text = read_md_header(full_path)
+                summary = summary_from_md(text, full_path)
+                if summary is not None:
+                    summaries.append(summary)
+            profiling.count("headers_read", len(files))
+            return summaries
+
+    def todo_listing(self):
+        """Open todos for ls and status: the SQLite index if it is enabled,
+        otherwise a TodoListing from a header-only scan."""
+        index = self.index()
+        if index is not None:
+            return index
+        return TodoListing(self.todo_summaries())
+
+    def search_index(self) -> SearchIndex:
+        """Full-text index, synced with a stat-only walk of the vault.
+
+        Changed files are parsed directly; the parse cache is not loaded.
+        """
+        with profiling.phase("search_index"):
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.search_index_file)
+            checked_ns = time.time_ns()
+            with profiling.phase("walk"):
+                files = self.index_files()
+            parsed = self._search_index.sync(
+                files,
+                lambda jobs: self.parse_files(
+                    [(PARSERS[kind], path) for path, kind in jobs]
+                ),
+                checked_ns,
+            )
+            profiling.count("files_parsed", parsed)
+            self._search_index.save()
+            return self._search_index
+
+    def index_files(self) -> dict[str, list[tuple[str, os.stat_result]]]:
+        """(path, stat) of every file the SQLite index mirrors, by directory key."""
+        files = {}
+        for key in INDEX_DIRS:
+            listing = self.get_files(self.required_dirs[key])
+            files[key] = [(full_path, st) for _, _, full_path, st in listing]
+        self.listings.save()
+        return files
+
+    def _open_index(self):
+        from ted.atomic import on_commit
+        from ted.sqlindex import SqlIndex
+
+        if self._index is None:
+            self._index = SqlIndex(
+                self.index_db_file,
+                {key: self.required_dirs[key] for key in INDEX_DIRS},
+            )
+            on_commit(self._index.update_paths)
+        return self._index
+
+    def index(self):
+        """The SQLite index synced with the vault, or None if it is not enabled.
+
+        Writes made through ted.atomic update it as they are committed.
+        """
+        if not os.path.exists(self.index_db_file):
+            self._close_index()
+            return None
+        index = self._open_index()
+        if not self._index_synced:
+            with profiling.phase("index_sync"):
+                checked_ns = time.time_ns()
+                index.sync(self.index_files(), checked_ns)
+            self._index_synced = True
+        return index
+
+    def rebuild_index(self) -> tuple[int, int]:
+        """Create the SQLite index or rebuild it from the markdown files."""
+        self._index_synced = True
+        checked_ns = time.time_ns()
+        return self._open_index().rebuild(self.index_files(), checked_ns)
+
+    def _close_index(self):
+        from ted.atomic import remove_commit_hook
+
+        if self._index is not None:
+            remove_commit_hook(self._index.update_paths)
+            self._index.close()
+            self._index = None
+            self._index_synced = False
+
+    def drop_index(self):
+        self._close_index()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.index_db_file + suffix):
+                os.remove(self.index_db_file + suffix)
+
+    def find(self, data_type: str, item_id: str, include_done: bool = False):
+        """Find an item like VaultData.find; "todos" only matches open todos
+        unless include_done is set.
+
+        Done todos are only loaded when no open todo matches. With the
+        SQLite index only the matching file is parsed.
+        """
+        index = self.index()
+        if index is None:
+            data = self.load_vault_data(**_ONLY[data_type])
+            item = data.find(data_type, item_id, include_done=False)
+            if item is None and include_done and data_type == "todos":
+                data = self.load_vault_data(
+                    todos=False, projects=False, references=False
+                )
+                item = data.find(data_type, item_id)
+            return item
+        path = index.find(data_type, item_id, include_done)
+        if path is None:
+            return None
+        return index.parse(path)
+
+    def get_next_id(self, data_type: str) -> int:
+        index = self.index()
+        if index is None:
+            collections = dict(_ONLY[data_type], dones=data_type == "todos")
+            return self.load_vault_data(**collections).get_next_id(data_type)
+        return index.get_next_id(data_type)
+
+    def rebuild_cache(self) -> VaultData:
+        self.cache.clear()
+        self.listings.clear()
+        return self.load_vault_data()
 
     def print_todos(self, todos):
         tmp_todos = [(dirs, todo) for dirs, todo in todos]
@@ -0,0 +1,104 @@
+import pytest
+import yaml
+
+from ted.data_types import Properties, parse_properties
+from ted.mdparse import parse_frontmatter
+
+# Strings PyYAML would load as something else if they were left unquoted.
+TRICKY = [
+    "2024-01-02",
+    "2024-01-02 10:20:30",
+    "yes",
+    "No",
+    "on",
+    "0x1F",
+    "0b101",
+    "1:20",
+    "1_000",
+    "1e3",
+    ".inf",
+    ".NaN",
+    "~",
+    "null",
+    "",
+    "''",
+    "it's",
+    "<<",
+    "=",
+    "-",
+    "#tag",
+    "a: b",
+    "a #b",
+    "key:",
+    "[1]",
+    "{a}",
+    "ünïcode ✅",
+    " padded ",
+]
+
+
+def properties_cases():
+    yield Properties(created="2024-01-02 10:00", id="1")
+    yield Properties(
+        created="2024-01-02T10:00:00",
+        id="0x10",
+        completed="yes",
+        project_id="2",
+        tags=["work", "2024-01-02", "~"],
+        blocked_by=["1:20", "3"],
+        info="''",
+    )
+    yield Properties(created="now", id="7", tags=[], blocked_by=[])
+    for value in TRICKY:
+        yield Properties(
+            created=value,
+            id=value,
+            completed=value,
+            project_id=value or None,
+            tags=[value, "plain"],
+            blocked_by=[value],
+            info=value,
+        )
+
+
+@pytest.mark.parametrize("properties", list(properties_cases()))
+def test_frontmatter_matches_yaml(properties):
+    text = str(properties).split("---\n")[1]
+    assert parse_frontmatter(text) == yaml.safe_load(text)
+
+
+@pytest.mark.parametrize("properties", list(properties_cases()))
+def test_properties_round_trip(properties):
+    parsed = parse_properties(str(properties))
+    assert parsed.model_dump() == properties.model_dump()
+    assert str(parsed) == str(properties)
+
+
+def test_plain_frontmatter_skips_yaml(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("fell back to YAML")
+
+    monkeypatch.setattr(yaml, "load", fail)
+    properties = Properties(
+        created="01-02-2024_10:00:00",
+        id="12",
+        project_id="3",
+        tags=["work", "home"],
+        blocked_by=["4"],
+        info="Some info",
+    )
+    assert parse_properties(str(properties)) == properties
+
+
+@pytest.mark.parametrize("value", TRICKY)
+def test_unquoted_scalars_match_yaml(value):
+    # Hand-edited frontmatter may leave these unquoted; the fast path must
+    # not turn them into strings YAML would not.
+    text = f"created: {value}\nid: 1\ntags:\n- {value}\n"
+    try:
+        expected = yaml.safe_load(text)
+    except yaml.YAMLError:
+        with pytest.raises(yaml.YAMLError):
+            parse_frontmatter(text)
+        return
+    assert parse_frontmatter(text) == expected
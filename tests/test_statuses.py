@@ -0,0 +1,31 @@
+import os
+
+from ted.data_types import todo_statuses
+from ted.mdparse import StatusSymbols
+
+
+def test_statuses_keyed_by_filepath():
+    todo_dir = os.path.join(os.sep, "vault", "todos")
+    top = os.path.join(todo_dir, "a.md")
+    nested = os.path.join(todo_dir, "sub", "a.md")
+    blocked = os.path.join(todo_dir, "b.md")
+    statuses = todo_statuses(
+        [
+            (top, [], False),
+            (nested, [], True),
+            (blocked, ["sub/a.md", "a.md"], True),
+        ],
+        todo_dir,
+    )
+    assert statuses == {
+        top: StatusSymbols.NOT_DONE,
+        nested: StatusSymbols.DONE,
+        blocked: StatusSymbols.BLOCKED,
+    }
+
+
+def test_blocked_by_cycle():
+    statuses = todo_statuses(
+        [("/t/a.md", ["b.md"], True), ("/t/b.md", ["a.md"], True)], "/t"
+    )
+    assert set(statuses.values()) == {StatusSymbols.BLOCKED}